@@ -0,0 +1,68 @@
+"""
+Per-frame cost of the annotation path used when saving video output.
+
+Compares the previous pipeline (temp JPEG write/read, BGR->RGB->PIL->numpy->BGR) against the
+in-memory path that draws directly on the decoded BGR frame. Runs offline on synthetic frames.
+
+    python benchmarks/bench_annotation.py --width 1920 --height 1080 --frames 200
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import cv2
+import numpy as np
+from PIL import Image
+
+from smretrofit import Retrofit
+from mock_server import fake_results
+
+
+# The pre-refactor save path: spill to temp/, read back, annotate in RGB, convert through PIL
+def legacy_render(retrofit, results, frame, temp_path):
+    cv2.imwrite(temp_path, frame)
+    image = cv2.imread(temp_path)
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    image = retrofit._img_data(results[0], results[1], image)
+    image = np.array(Image.fromarray(image))
+    image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    os.remove(temp_path)
+    return image
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--boxes', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    retrofit = Retrofit()
+    frame = np.random.default_rng(0).integers(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+    results = [fake_results(args.width, args.height, args.boxes, rng) for _ in range(args.frames)]
+
+    with tempfile.TemporaryDirectory() as temp:
+        temp_path = os.path.join(temp, 'frame.jpg')
+        start = time.perf_counter()
+        for result in results:
+            legacy_render(retrofit, result, frame.copy(), temp_path)
+        legacy = (time.perf_counter() - start) / args.frames
+
+    start = time.perf_counter()
+    for result in results:
+        retrofit._render_frame(result, frame.copy())
+    in_memory = (time.perf_counter() - start) / args.frames
+    retrofit.close()
+
+    print(f'{args.width}x{args.height}, {args.boxes} boxes per model, {args.frames} frames')
+    print(f'temp JPEG + PIL round trip: {legacy * 1000:.2f} ms/frame')
+    print(f'in-memory BGR:              {in_memory * 1000:.2f} ms/frame')
+    print(f'saved per frame:            {(legacy - in_memory) * 1000:.2f} ms ({legacy / in_memory:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+End-to-end latency of live stream ingest against the bundled mock detection server.
+
+Replays a synthetic video at its frame rate through Retrofit.watch_stream, as if it came from a camera,
+and reports for each max_in_flight how many frames were analyzed per second, the share of captured
+frames dropped as stale, and the capture-to-results latency percentiles. With enough uploads in flight
+every frame is analyzed; with too few, stale frames are dropped but latency stays bounded.
+
+    python benchmarks/bench_live.py --latency 0.1 --max-in-flight 1 2 4 8
+    python benchmarks/bench_live.py --resolution 1920x1080 --fps 30 --seconds 20 --save
+"""
+
+import argparse
+import os
+import tempfile
+
+from smretrofit import Retrofit
+from mock_server import start_server
+from bench_throughput import make_video, parse_resolution
+
+
+def run_case(url, video, max_in_flight, save, output):
+    with Retrofit(url=url, pool_size=max(10, max_in_flight), hooks=[]) as retrofit:
+        summary = retrofit.watch_stream(video, lambda *record: None, save=save, output=output,
+                                        max_in_flight=max_in_flight, realtime=True)
+    captured = summary.counters.get('captured', 0)
+    latency = summary.stages.get('latency', {})
+    return {
+        'analyzed_fps': summary.counters.get('frames', 0) / summary.elapsed if summary.elapsed else 0.0,
+        'stale_pct': summary.counters.get('stale', 0) / captured * 100 if captured else 0.0,
+        'p50_ms': latency.get('p50', 0.0) * 1000,
+        'p99_ms': latency.get('p99', 0.0) * 1000,
+        'dropped': summary.counters.get('dropped', 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resolution', type=parse_resolution, default=(1280, 720))
+    parser.add_argument('--fps', type=int, default=25)
+    parser.add_argument('--seconds', type=int, default=10, help='length of the replayed video')
+    parser.add_argument('--max-in-flight', nargs='+', type=int, default=[1, 2, 4])
+    parser.add_argument('--save', action='store_true', help='record annotated segments')
+    parser.add_argument('--boxes', type=int, default=5, help='boxes per model in each mock response')
+    parser.add_argument('--latency', type=float, default=0.1, help='mock server latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.02, help='mock server latency jitter in seconds')
+    args = parser.parse_args()
+
+    server, url = start_server(boxes=args.boxes, latency=args.latency, jitter=args.jitter)
+    try:
+        with tempfile.TemporaryDirectory() as temp:
+            width, height = args.resolution
+            video = make_video(os.path.join(temp, 'live.mp4'), width, height, args.fps * args.seconds, args.fps)
+            print(f"{'max_in_flight':>13} {'analyzed/s':>10} {'stale %':>8} {'p50 ms':>8} {'p99 ms':>8} {'dropped':>7}")
+            for max_in_flight in args.max_in_flight:
+                record = run_case(url, video, max_in_flight, args.save, os.path.join(temp, 'output', ''))
+                print(f"{max_in_flight:>13} {record['analyzed_fps']:>10.1f} {record['stale_pct']:>8.1f} "
+                      f"{record['p50_ms']:>8.1f} {record['p99_ms']:>8.1f} {record['dropped']:>7}")
+    finally:
+        server.terminate()
+        server.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+End-to-end throughput of Retrofit against the bundled mock detection server.
+
+Starts benchmarks/mock_server.py in a separate process and runs get_image_data, get_video_data and
+get_video_data_sample across detect/label modes, resolutions and video lengths on synthetic media.
+Each case reports frames per second, upload p50/p99 latency and peak Python memory (measured in a
+separate traced run so tracing does not skew throughput). Save a run with --json and compare a later
+one against it with --baseline to catch regressions before release; the exit code is 1 when any
+case is slower than the baseline by more than --tolerance.
+
+    python benchmarks/bench_throughput.py --resolutions 640x480 1920x1080 --lengths 30 120
+    python benchmarks/bench_throughput.py --latency 0.05 --error-rate 0.02 --max-in-flight 8
+    python benchmarks/bench_throughput.py --json before.json
+    python benchmarks/bench_throughput.py --baseline before.json --tolerance 0.1
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import cv2
+import numpy as np
+
+from smretrofit import AdaptiveLimiter, Retrofit, Metrics, MetricsHook
+from mock_server import start_server
+
+
+MODES = ("all", "defect", "rating")
+METHODS = ("image", "video", "sample")
+
+
+# Accumulates stage timings and counters over every call made by one benchmark case
+class Collector(MetricsHook):
+    def __init__(self):
+        self.metrics = Metrics()
+
+    def on_stage(self, stage, seconds):
+        self.metrics.observe(stage, seconds)
+
+    def on_finish(self, summary):
+        for name, value in summary.counters.items():
+            self.metrics.count(name, value)
+
+
+# A textured frame with a moving block, so every frame encodes differently
+def synthetic_frame(width, height, index):
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frame = np.empty((height, width, 3), np.uint8)
+    frame[..., 0] = (x + y) / 2
+    frame[..., 1] = (x * 3 + index * 5) % 256
+    frame[..., 2] = (y * 2 + index * 3) % 256
+    size = max(16, min(width, height) // 5)
+    left = index * 7 % max(1, width - size)
+    top = index * 5 % max(1, height - size)
+    frame[top:top + size, left:left + size] = (40, 200, 255)
+    return frame
+
+
+def make_image(path, width, height):
+    cv2.imwrite(path, synthetic_frame(width, height, 0))
+    return path
+
+
+def make_video(path, width, height, frames, fps=25):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    for index in range(frames):
+        writer.write(synthetic_frame(width, height, index))
+    writer.release()
+    return path
+
+
+def parse_resolution(value):
+    try:
+        width, height = value.lower().split('x')
+        return int(width), int(height)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid resolution '{value}', expected WIDTHxHEIGHT.")
+
+
+def run_case(url, mode, method, media, args, output):
+    collector = Collector()
+    limiter = AdaptiveLimiter() if args.adaptive else None
+    retrofit = Retrofit(url=url, detect_mode=mode, label_mode=mode, pool_size=max(10, args.max_in_flight),
+                        hooks=[collector], concurrency=limiter)
+
+    def run():
+        if method == 'image':
+            for _ in range(args.images):
+                retrofit.get_image_data(media, save=args.save, output=output)
+        elif method == 'video':
+            retrofit.get_video_data(media, save=args.save, output=output, max_in_flight=args.max_in_flight)
+        else:
+            retrofit.get_video_data_sample(media, save=args.save, sample=args.sample, output=output, strategy='even')
+
+    try:
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        summary = collector.metrics.summary()
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    finally:
+        retrofit.close()
+
+    frames = summary.counters.get('frames', 0)
+    upload = summary.stages.get('upload', {})
+    return {
+        'frames': frames,
+        'seconds': elapsed,
+        'fps': frames / elapsed if elapsed else 0.0,
+        'p50_ms': upload.get('p50', 0.0) * 1000,
+        'p99_ms': upload.get('p99', 0.0) * 1000,
+        'peak_mb': peak / 1024 ** 2,
+        'retries': summary.counters.get('retries', 0),
+        'throttled': summary.counters.get('throttled', 0),
+        'dropped': summary.counters.get('dropped', 0),
+    }
+
+
+def compare(records, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = {record['case']: record for record in json.load(f)['cases']}
+    regressions = []
+    for record in records:
+        before = baseline.get(record['case'])
+        if before and before['fps'] and record['fps'] < before['fps'] * (1 - tolerance):
+            regressions.append((record['case'], before['fps'], record['fps']))
+    for case, before, after in regressions:
+        print(f'REGRESSION {case}: {before:.1f} -> {after:.1f} frames/s ({(after / before - 1) * 100:+.1f}%)')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--methods', nargs='+', choices=METHODS, default=list(METHODS))
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--resolutions', nargs='+', type=parse_resolution, default=[(640, 480), (1920, 1080)])
+    parser.add_argument('--lengths', nargs='+', type=int, default=[30, 120], help='video lengths in frames')
+    parser.add_argument('--images', type=int, default=20, help='get_image_data calls per image case')
+    parser.add_argument('--sample', type=int, default=10, help='frames per get_video_data_sample call')
+    parser.add_argument('--max-in-flight', type=int, default=4)
+    parser.add_argument('--adaptive', action='store_true', help='let an AdaptiveLimiter pace uploads within --max-in-flight')
+    parser.add_argument('--no-save', dest='save', action='store_false', help='skip annotation and writing output')
+    parser.add_argument('--boxes', type=int, default=5, help='boxes per model in each mock response')
+    parser.add_argument('--latency', type=float, default=0.0, help='mock server latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='mock server latency jitter in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of mock requests answered with 503')
+    parser.add_argument('--capacity', type=int, help='mock requests served at once; more are answered with 429')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='compare against results previously written with --json')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed frames/s drop against the baseline')
+    args = parser.parse_args()
+
+    server, url = start_server(boxes=args.boxes, latency=args.latency, jitter=args.jitter,
+                               error_rate=args.error_rate, capacity=args.capacity)
+    records = []
+    try:
+        with tempfile.TemporaryDirectory() as temp:
+            output = os.path.join(temp, 'output', '')
+            print(f"{'case':<32} {'frames':>6} {'frames/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'peak MB':>8} "
+                  f"{'retries':>7} {'429s':>5}")
+            for width, height in args.resolutions:
+                image = make_image(os.path.join(temp, f'{width}x{height}.jpg'), width, height)
+                videos = {length: make_video(os.path.join(temp, f'{width}x{height}_{length}.mp4'), width, height,
+                                             length) for length in args.lengths}
+                for mode in args.modes:
+                    cases = []
+                    if 'image' in args.methods:
+                        cases.append((f'image {mode} {width}x{height}', 'image', image))
+                    for length, video in videos.items():
+                        for method in ('video', 'sample'):
+                            if method in args.methods:
+                                cases.append((f'{method} {mode} {width}x{height} {length}f', method, video))
+                    for case, method, media in cases:
+                        record = {'case': case, **run_case(url, mode, method, media, args, output)}
+                        records.append(record)
+                        print(f"{case:<32} {record['frames']:>6} {record['fps']:>9.1f} {record['p50_ms']:>8.2f} "
+                              f"{record['p99_ms']:>8.2f} {record['peak_mb']:>8.1f} {record['retries']:>7} "
+                              f"{record['throttled']:>5}")
+    finally:
+        server.terminate()
+        server.join()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'options': vars(args), 'cases': records}, f, indent=2)
+    if args.baseline and compare(records, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
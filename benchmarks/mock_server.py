@@ -0,0 +1,179 @@
+"""
+Local stand-in for the Somikoron detection API, for benchmarks and offline development.
+
+Accepts the same multipart upload as the real endpoint and answers with results JSON of the same
+shape: random boxes inside the uploaded image, with a configurable number of boxes per model,
+response latency and error rate. Failed requests answer 503, which the client retries, and requests
+beyond the server's capacity answer 429 with a Retry-After header.
+
+    python benchmarks/mock_server.py --port 8000 --boxes 5 --latency 0.05 --error-rate 0.01 --capacity 8
+
+Then point a client at it with Retrofit(url="http://127.0.0.1:8000/api/").
+"""
+
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import itertools
+import json
+import multiprocessing
+import random
+import threading
+import time
+import cv2
+import numpy as np
+
+
+DEFECT_CLASSES = ["Corrosion", "Crack", "Abnormal Spacing", "Functional Disorder of Bearing", "Spalling/Exposed Rebar"]
+RATING_CLASSES = ["Corrosion_Dt", "Crack_Ct", "Abnormal Spacing_Ct", "Functional Disorder of Bearing_Ct",
+                  "Spalling/Exposed Rebar_Ct", "Corrosion_Ct", "Crack_Dt", "Abnormal Spacing_Bt",
+                  "Functional Disorder of Bearing_Bt", "Spalling/Exposed Rebar_Bt"]
+
+
+def fake_results(width, height, boxes, rng):
+    results = []
+    for classes in (DEFECT_CLASSES, RATING_CLASSES):
+        data = []
+        for _ in range(boxes):
+            x1, y1 = rng.uniform(0, width * 0.8), rng.uniform(0, height * 0.8)
+            x2, y2 = x1 + rng.uniform(20, width * 0.2), y1 + rng.uniform(20, height * 0.2)
+            data.append({'box_xyxy': [x1, y1, x2, y2], 'box_cls': rng.randrange(len(classes)), 'box_conf': rng.random()})
+        results.append({'data': data, 'cls': {str(i): name for i, name in enumerate(classes)}})
+    return results
+
+
+# Bytes of the 'file' part of a multipart/form-data body
+def uploaded_file(body, content_type):
+    boundary = content_type.split('boundary=', 1)[-1].strip('"').encode()
+    for part in body.split(b'--' + boundary):
+        header, _, content = part.partition(b'\r\n\r\n')
+        if b'name="file"' in header:
+            return content[:-2] if content.endswith(b'\r\n') else content
+    return b''
+
+
+# Image size without a full decode: the 1/8 reduced decode is enough to place boxes
+def image_size(data):
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if image is None:
+        return None
+    height, width = image.shape[:2]
+    return width * 8, height * 8
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # Otherwise delayed ACKs add ~40 ms to every keep-alive response
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output clean
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        rng = random.Random(server.next_seed())
+        if not server.enter():
+            self._reply(429, 'text/plain', b'Too Many Requests', {'Retry-After': '1'})
+            return
+        try:
+            self._respond(server, body, rng)
+        finally:
+            server.leave()
+
+    def _respond(self, server, body, rng):
+        if server.latency or server.jitter:
+            time.sleep(max(0.0, server.latency + rng.uniform(-server.jitter, server.jitter)))
+        if rng.random() < server.error_rate:
+            self._reply(503, 'text/plain', b'Service Unavailable')
+            return
+        size = image_size(uploaded_file(body, self.headers.get('Content-Type', '')))
+        if size is None:
+            self._reply(400, 'text/plain', b'Invalid image')
+            return
+        payload = json.dumps({'results': fake_results(size[0], size[1], server.boxes, rng)}).encode('utf-8')
+        self._reply(200, 'application/json', payload)
+
+    def _reply(self, status, content_type, payload, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), boxes=5, latency=0.0, jitter=0.0, error_rate=0.0, seed=0,
+                 capacity=None):
+        super().__init__(address, MockHandler)
+        self.boxes = boxes
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.capacity = capacity  # Requests served at once; None for unlimited
+        self.active = 0
+        self._active_lock = threading.Lock()
+        self._seeds = itertools.count(seed + 1)
+
+    def enter(self):
+        with self._active_lock:
+            if self.capacity is not None and self.active >= self.capacity:
+                return False
+            self.active += 1
+            return True
+
+    def leave(self):
+        with self._active_lock:
+            self.active -= 1
+
+    # A distinct, reproducible seed per request
+    def next_seed(self):
+        return next(self._seeds)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/api/'
+
+
+def _serve(ready, options):
+    server = MockServer(**options)
+    ready.put(server.url)
+    server.serve_forever()
+
+
+# Run the server in a separate process so it does not compete with the client for the GIL
+def start_server(**options):
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(ready, options), daemon=True)
+    process.start()
+    return process, ready.get(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--boxes', type=int, default=5, help='boxes per model in each response')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='uniform +/- seconds around the latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--capacity', type=int, help='requests served at once; more are answered with 429')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockServer((args.host, args.port), args.boxes, args.latency, args.jitter, args.error_rate, args.seed,
+                        args.capacity)
+    print(f'Serving mock detection API on {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
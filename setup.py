@@ -14,6 +14,11 @@ setup(
         'numpy',
         # 'cryptography'
     ],
+    extras_require={
+        'async': ['aiohttp'],
+        'fast': ['orjson'],
+        'parquet': ['pyarrow'],
+    },
     long_description=description,
     long_description_content_type='text/markdown',
     keywords='computer vision requests image and video processing',
@@ -1 +1,9 @@
 from .smretrofit import Retrofit
+from .async_retrofit import AsyncRetrofit
+from .cache import ResultCache
+from .change import ChangeDetector
+from .tracking import BoxTracker
+from .renderer import Renderer
+from .results import Detections, FrameResult, VideoResults
+from .metrics import Metrics, MetricsHook, ProgressPrinter, Summary
+from .concurrency import AdaptiveLimiter
@@ -0,0 +1,364 @@
+"""
+Asyncio counterpart of Retrofit for services built around an event loop.
+
+Uploads go through one shared aiohttp connection pool and a semaphore that bounds how many
+requests are in flight at once. Frame decoding, JPEG encoding and annotation run in the default
+executor so the event loop never blocks on OpenCV work.
+"""
+
+from collections import deque
+import asyncio
+import functools
+import json
+import os
+import time
+import cv2
+
+from .smretrofit import Retrofit
+from .concurrency import RETRY_STATUS_CODES, retry_after_seconds
+from .frames import FrameProducer, RING_SLACK
+from .results import FrameResult, VideoResults, loads
+from .tiling import merge_tiles, tile_windows
+from .metrics import NO_METRICS
+
+try:
+    import aiohttp
+except ImportError:  # Optional dependency: pip install smretrofit[async]
+    aiohttp = None
+
+
+class AsyncRetrofit(Retrofit):
+    def __init__(self, url="https://api.somikoron.ai/api/", auth_key="", auth_pass="",
+                  font_size=7, font_thickness=3, line_space=10, detect_mode="all", label_mode="all",
+                  pool_size=100, keep_alive=True, timeout=(10, 120), retries=3, backoff_factor=0.5, cache=None,
+                  max_side=None, max_pixels=None, image_format="jpg", quality=95, hooks=None, concurrency=None,
+                  max_in_flight=32):
+        if aiohttp is None:
+            raise ImportError("AsyncRetrofit requires aiohttp. Install it with 'pip install smretrofit[async]'.")
+        if max_in_flight < 1:
+            raise ValueError(f"Invalid max_in_flight: {max_in_flight}. It must be at least 1.")
+        super().__init__(url, auth_key, auth_pass, font_size, font_thickness, line_space, detect_mode, label_mode,
+                         pool_size, keep_alive, timeout, retries, backoff_factor, cache,
+                         max_side, max_pixels, image_format, quality, hooks, concurrency)
+        self.max_in_flight = max_in_flight
+        # Created lazily so they bind to the running event loop
+        self._async_session = None
+        self._semaphore = None
+
+    def _get_async_session(self):
+        if self._async_session is None or self._async_session.closed:
+            if isinstance(self.timeout, tuple):
+                connect, read = self.timeout
+                timeout = aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+            else:
+                timeout = aiohttp.ClientTimeout(total=self.timeout)
+            connector = aiohttp.TCPConnector(limit=max(self.pool_size, self.max_in_flight), force_close=not self.keep_alive)
+            self._async_session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._async_session
+
+    # Upload a buffer and return (status, content type, body text), serving repeats from the cache
+    async def _apost(self, data, filename='file', metrics=NO_METRICS):
+        if self.cache is None:
+            return await self._apost_uncached(data, filename, metrics)
+        loop = asyncio.get_running_loop()
+        key = self.cache.key(self.url, data)
+        body = await loop.run_in_executor(None, self.cache.get, key)
+        if body is not None:
+            metrics.count('cache_hits')
+            return 200, 'application/json', body
+        status, content_type, text = await self._apost_uncached(data, filename, metrics)
+        if status == 200 and 'application/json' in content_type:
+            await loop.run_in_executor(None, self.cache.set, key, text)
+        return status, content_type, text
+
+    # Retries connect errors, 429 and 5xx with exponential backoff
+    async def _apost_uncached(self, data, filename, metrics):
+        session = self._get_async_session()
+        metrics.count('uploads')
+        metrics.count('bytes_uploaded', memoryview(data).nbytes)
+        with metrics.timer('upload'):
+            return await self._apost_attempts(session, data, filename, metrics)
+
+    async def _apost_attempts(self, session, data, filename, metrics):
+        attempt = 0
+        while True:
+            try:
+                status, content_type, text, retry_after = await self._apost_once(session, data, filename)
+                if status == 429:
+                    metrics.count('throttled')
+                if status not in RETRY_STATUS_CODES or attempt >= self.retries:
+                    return status, content_type, text
+                delay = self._retry_delay(attempt, retry_after)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt >= self.retries:
+                    raise
+                delay = self._retry_delay(attempt)
+            attempt += 1
+            metrics.count('retries')
+            await asyncio.sleep(delay)
+
+    # One attempt, holding a slot of the adaptive limiter or of the fixed max_in_flight semaphore.
+    # Slots are not held while waiting to retry.
+    async def _apost_once(self, session, data, filename):
+        # aiohttp consumes a FormData once, so it is rebuilt for every attempt
+        form = aiohttp.FormData()
+        for key, value in self.credential.items():
+            form.add_field(key, value)
+        form.add_field('file', memoryview(data).cast('B'), filename=filename)  # Sent without copying
+        if self.limiter is None:
+            async with self._semaphore:
+                async with session.post(self.url, data=form) as response:
+                    text = await response.text()
+                    return response.status, response.headers.get('Content-Type', ''), text, \
+                        response.headers.get('Retry-After')
+        await self.limiter.acquire_async()
+        start = time.perf_counter()
+        status = retry_after = None
+        try:
+            async with session.post(self.url, data=form) as response:
+                text = await response.text()
+                status, retry_after = response.status, response.headers.get('Retry-After')
+                return status, response.headers.get('Content-Type', ''), text, retry_after
+        finally:
+            self.limiter.release(time.perf_counter() - start, status, retry_after_seconds(retry_after))
+
+    # Returns the (status, content type, body text) response and the upload scale
+    async def _asend_frame(self, frame, metrics=NO_METRICS):
+        loop = asyncio.get_running_loop()
+        with metrics.timer('encode'):
+            encoded_image, scale = await loop.run_in_executor(None, self._encode_frame, frame)
+        return await self._apost(encoded_image, metrics=metrics), scale
+
+    async def close(self):
+        if self._async_session is not None:
+            await self._async_session.close()
+        super().close()
+
+    # close() is a coroutine here, so the inherited __exit__ would never await it and leak the session
+    def __enter__(self):
+        raise TypeError("AsyncRetrofit must be used with 'async with AsyncRetrofit(...)', not 'with'.")
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        raise TypeError("AsyncRetrofit must be used with 'async with AsyncRetrofit(...)', not 'with'.")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    # Async iterator over (frame_index, timestamp, results, annotated_frame_or_None) in frame order
+    async def iter_video_data(self, file_path, save=False, output="output/", max_in_flight=None, skip_similar=None,
+                              metrics=None):
+        loop = asyncio.get_running_loop()
+        if max_in_flight is None:
+            max_in_flight = self.max_in_flight
+        if max_in_flight < 1:
+            raise ValueError(f"Invalid max_in_flight: {max_in_flight}. It must be at least 1.")
+        if not os.path.isfile(file_path):
+            raise FileNotFoundError(f"The file '{file_path}' does not exist.")
+        if not self._is_video_file(file_path):
+            raise ValueError(f"The file '{file_path}' is not a valid video file.")
+        if save and not os.path.exists(output):
+            os.makedirs(output)
+
+        detector = self._change_detector(skip_similar)
+        if detector is not None:
+            detector.reset()
+        if metrics is None:
+            metrics = self._new_metrics()
+
+        cap = await loop.run_in_executor(None, cv2.VideoCapture, file_path)
+        out = None
+        # Near-duplicate frames share the task of the last submitted frame and reuse its results
+        pending = deque()
+        in_flight = 0
+        last_upload = None
+        producer = None
+        try:
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            if save:
+                frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                output_video_path = f'{output}{os.path.basename(file_path)}'
+                fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+                out = cv2.VideoWriter(output_video_path, fourcc, int(fps), (frame_width, frame_height))
+            # Frames are decoded ahead on a producer thread into a ring of reusable buffers
+            producer = FrameProducer(cap, max_in_flight + RING_SLACK, metrics=metrics)
+            while True:
+                item = await loop.run_in_executor(None, producer.next)
+                ret = item is not None
+                if ret:
+                    frame_index, frame = item
+                    uploaded = detector is None or await loop.run_in_executor(None, detector.should_submit, frame)
+                    if uploaded:
+                        last_upload = asyncio.ensure_future(self._asend_frame(frame, metrics))
+                        in_flight += 1
+                    else:
+                        metrics.count('skipped')
+                    pending.append((frame_index, frame, last_upload, uploaded))
+                # Keep at most max_in_flight uploads outstanding and hand back finished frames as soon as
+                # possible; drain everything at the end of the video
+                while pending and (not ret or in_flight >= max_in_flight or len(pending) >= producer.size
+                                   or pending[0][2].done()):
+                    index, frame, upload, uploaded = pending.popleft()
+                    if uploaded:
+                        in_flight -= 1
+                    try:
+                        (status, content_type, text), scale = await upload
+                        metrics.count('frames')
+                        metrics.progress(index, total_frames)
+                        if status != 200 or 'application/json' not in content_type:
+                            metrics.count('dropped')
+                            continue  # Frame dropped, as in the blocking client
+                        with metrics.timer('parse'):
+                            results = self._rescale_results(loads(text)['results'], scale)
+                        annotated_frame = None
+                        if save:
+                            with metrics.timer('render'):
+                                annotated_frame = await loop.run_in_executor(None, self._render_frame, results, frame)
+                            with metrics.timer('write'):
+                                await loop.run_in_executor(None, out.write, annotated_frame)
+                        timestamp = (index - 1) / fps if fps else 0.0
+                        yield index, timestamp, results, annotated_frame
+                    finally:
+                        producer.release(frame)  # The buffer is decoded into again; copy yielded frames to keep them
+                if not ret:
+                    break  # End of video
+            metrics.finish()
+        finally:
+            if producer is not None:
+                await loop.run_in_executor(None, producer.close)
+            for _, _, upload, _ in pending:
+                upload.cancel()
+            cap.release()
+            if out is not None:
+                out.release()
+
+    async def get_video_data(self, file_path, save=False, output="output/", temp="temp/", max_in_flight=None,
+                             skip_similar=None, as_arrays=False, with_summary=False):
+        result_data = VideoResults() if as_arrays else []
+        metrics = self._new_metrics()
+        try:
+            async for index, timestamp, results, _ in self.iter_video_data(file_path, save, output, max_in_flight,
+                                                                           skip_similar, metrics):
+                if as_arrays:
+                    result_data.append(FrameResult.from_results(results, index, timestamp))
+                else:
+                    result_data.append(results)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise Exception(f"An error occurred during the request: {e}")
+        if not as_arrays:
+            result_data = self._select_results(result_data)
+        if with_summary:
+            return result_data, metrics.summary()
+        return result_data
+
+    async def get_video_data_sample(self, file_path, save=False, sample=3, output="output/", temp="temp/",
+                                    strategy="random", seed=None, interval=None, with_summary=False):
+        # Only a handful of frames are uploaded, so the blocking implementation just runs off the event loop
+        loop = asyncio.get_running_loop()
+        blocking = functools.partial(super().get_video_data_sample, file_path, save, sample, output, temp,
+                                     strategy, seed, interval, with_summary)
+        return await loop.run_in_executor(None, blocking)
+
+    async def get_image_data(self, file_path, save=False, output="output/", as_arrays=False, tile=None, overlap=0.2):
+        metrics = self._new_metrics()
+        os.makedirs(output, exist_ok=True)
+        results = await self._aimage_data(file_path, save, output, as_arrays, metrics, tile, overlap)
+        metrics.finish()
+        return results
+
+    async def _aimage_data(self, file_path, save, output, as_arrays, metrics, tile=None, overlap=0.2):
+        loop = asyncio.get_running_loop()
+        with metrics.timer('read'):
+            data = await loop.run_in_executor(None, self._read_image, file_path)
+        try:
+            frame = None
+            if save or tile:
+                with metrics.timer('decode'):
+                    frame = await loop.run_in_executor(None, self._decode_image, data, file_path)
+            windows = tile_windows(frame.shape[1], frame.shape[0], tile, overlap) if tile else None
+            tiled = windows is not None and len(windows) > 1
+            if tiled:
+                # Tiles share the client's max_in_flight bound with every other upload
+                uploads = await asyncio.gather(*(self._asend_frame(frame[y1:y2, x1:x2], metrics)
+                                                 for x1, y1, x2, y2 in windows))
+                metrics.count('tiles', len(windows))
+            else:
+                with metrics.timer('encode'):
+                    payload, filename, scale = await loop.run_in_executor(None, self._prepare_image, data,
+                                                                          os.path.basename(file_path), frame)
+                uploads = [(await self._apost(payload, filename, metrics), scale)]
+            metrics.count('frames')
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise Exception(f"An error occurred during the request: {e}")
+        results = []
+        for (status, content_type, text), scale in uploads:
+            if status != 200:
+                raise Exception(f"Failed to get a valid response. Status code: {status}, Response: {text}")
+            if 'application/json' not in content_type:
+                raise ValueError("Unexpected response format.")
+            with metrics.timer('parse'):
+                results.append(self._rescale_results(loads(text)['results'], scale))
+        if tiled:
+            with metrics.timer('merge'):
+                results = merge_tiles(results, windows)
+        else:
+            results = results[0]
+        if save:
+            with metrics.timer('render'):
+                image = await loop.run_in_executor(None, self._render_frame, results, frame)
+            os.makedirs(output, exist_ok=True)
+            with metrics.timer('write'):
+                await loop.run_in_executor(None, cv2.imwrite, f'{output}/{os.path.basename(file_path)}', image)
+        if as_arrays:
+            return FrameResult.from_results(results)
+        return self._select_image_results(results)
+
+    # Files are processed by `workers` tasks (default: max_in_flight), so only that many images are held in memory
+    # at once; records are appended to jsonl_path as files finish
+    async def get_images_data(self, paths, save=False, output="output/", workers=None, jsonl_path=None,
+                              with_summary=False, tile=None, overlap=0.2):
+        file_paths = self._list_files(paths)
+        if workers is None:
+            workers = self.max_in_flight
+        if workers < 1:
+            raise ValueError(f"Invalid workers: {workers}. It must be at least 1.")
+        if save and not os.path.exists(output):
+            os.makedirs(output)
+        records = {}
+        metrics = self._new_metrics()
+        jsonl = open(jsonl_path, 'a') if jsonl_path else None
+        remaining = iter(file_paths)
+
+        # Each worker takes the next file once its previous one is done
+        async def worker():
+            for file_path in remaining:
+                record = await self._aimage_record(file_path, save, output, metrics, tile, overlap)
+                records[record['file']] = record
+                if jsonl is not None:
+                    jsonl.write(json.dumps(record) + '\n')
+                    jsonl.flush()
+                metrics.progress(len(records), len(file_paths))
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(workers, len(file_paths)))))
+        finally:
+            if jsonl is not None:
+                jsonl.close()
+        summary = metrics.finish()
+        records = [records[file_path] for file_path in file_paths]
+        if with_summary:
+            return records, summary
+        return records
+
+    async def _aimage_record(self, file_path, save, output, metrics, tile=None, overlap=0.2):
+        try:
+            results = await self._aimage_data(file_path, save, output, False, metrics, tile, overlap)
+            return {'file': file_path, 'results': results, 'error': None}
+        except Exception as e:
+            metrics.count('errors')
+            return {'file': file_path, 'results': None, 'error': str(e)}
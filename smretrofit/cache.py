@@ -0,0 +1,147 @@
+"""
+Content-addressed on-disk cache for API responses.
+
+Responses are keyed by a SHA-256 of the endpoint and the uploaded bytes, so re-submitting the
+same pixels (for example to re-render with another label_mode or font_size) is served locally.
+Entries live in a SQLite database in WAL mode, which lets several threads and processes share
+one cache directory safely. The least recently used entries are evicted once the cache grows
+past max_size bytes, and entries older than max_age seconds are dropped.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+class CachedResponse:
+    # Stands in for a requests.Response when the results are served from the cache
+    status_code = 200
+
+    def __init__(self, text):
+        self.text = text
+        self.content = text.encode('utf-8')
+        self.headers = {'Content-Type': 'application/json'}
+
+
+class ResultCache:
+    def __init__(self, directory=".smretrofit_cache", max_size=512 * 1024 * 1024, max_age=None):
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = os.path.join(directory, 'results.sqlite3')
+        self.max_size = max_size
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # sqlite3 connections cannot be shared between threads, so each thread opens its own
+        self._local = threading.local()
+        db = self._connect()
+        # One immediate transaction, so no other process writes entries between seeding the running
+        # total and creating the triggers that keep it up to date
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute('CREATE TABLE IF NOT EXISTS results ('
+                       'key TEXT PRIMARY KEY, body TEXT NOT NULL, size INTEGER NOT NULL, '
+                       'created REAL NOT NULL, accessed REAL NOT NULL)')
+            db.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)')
+            db.execute('CREATE INDEX IF NOT EXISTS results_created ON results (created)')
+            # Total size of the entries, kept by triggers so eviction does not have to sum the table
+            db.execute('CREATE TABLE IF NOT EXISTS usage (id INTEGER PRIMARY KEY CHECK (id = 0), '
+                       'size INTEGER NOT NULL)')
+            db.execute('INSERT OR IGNORE INTO usage (id, size) '
+                       'SELECT 0, COALESCE(SUM(size), 0) FROM results')
+            db.execute('CREATE TRIGGER IF NOT EXISTS results_insert AFTER INSERT ON results BEGIN '
+                       'UPDATE usage SET size = size + new.size; END')
+            db.execute('CREATE TRIGGER IF NOT EXISTS results_delete AFTER DELETE ON results BEGIN '
+                       'UPDATE usage SET size = size - old.size; END')
+            db.execute('CREATE TRIGGER IF NOT EXISTS results_update AFTER UPDATE OF size ON results BEGIN '
+                       'UPDATE usage SET size = size - old.size + new.size; END')
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+
+    # Pickled as its settings, so worker processes open their own connections to the same cache
+    def __reduce__(self):
+        return ResultCache, (self.directory, self.max_size, self.max_age)
+
+    def _connect(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            # The busy timeout makes writers from other processes wait instead of failing
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute('PRAGMA journal_mode=WAL')
+            self._local.db = db
+        return db
+
+    @staticmethod
+    def key(endpoint, data):
+        digest = hashlib.sha256(endpoint.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(data)
+        return digest.hexdigest()
+
+    # Return the cached response body, or None on a miss
+    def get(self, key):
+        db = self._connect()
+        now = time.time()
+        row = db.execute('SELECT body, created FROM results WHERE key = ?', (key,)).fetchone()
+        if row is not None and self.max_age is not None and now - row[1] > self.max_age:
+            with db:
+                db.execute('DELETE FROM results WHERE key = ?', (key,))
+            row = None
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        with db:
+            db.execute('UPDATE results SET accessed = ? WHERE key = ?', (now, key))
+        with self._lock:
+            self.hits += 1
+        return row[0]
+
+    def set(self, key, body):
+        db = self._connect()
+        now = time.time()
+        with db:
+            # An upsert rather than INSERT OR REPLACE, whose implicit delete would skip the size trigger
+            db.execute('INSERT INTO results (key, body, size, created, accessed) VALUES (?, ?, ?, ?, ?) '
+                       'ON CONFLICT (key) DO UPDATE SET body = excluded.body, size = excluded.size, '
+                       'created = excluded.created, accessed = excluded.accessed',
+                       (key, body, len(body.encode('utf-8')), now, now))
+        self._evict(db, now)
+
+    def _evict(self, db, now):
+        with db:
+            if self.max_age is not None:
+                db.execute('DELETE FROM results WHERE created < ?', (now - self.max_age,))
+            if self.max_size is None:
+                return
+            total = db.execute('SELECT size FROM usage').fetchone()[0]
+            if total <= self.max_size:
+                return
+            # Drop least recently used entries until the cache fits again
+            stale = []
+            for key, size in db.execute('SELECT key, size FROM results ORDER BY accessed ASC'):
+                if total <= self.max_size:
+                    break
+                stale.append((key,))
+                total -= size
+            db.executemany('DELETE FROM results WHERE key = ?', stale)
+
+    def stats(self):
+        db = self._connect()
+        entries = db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        size = db.execute('SELECT size FROM usage').fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'size': size}
+
+    def clear(self):
+        db = self._connect()
+        with db:
+            db.execute('DELETE FROM results')
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
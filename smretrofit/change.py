@@ -0,0 +1,49 @@
+"""
+Change detection used to skip uploading frames that look like the last submitted one.
+
+Frames are compared on a tiny thumbnail: either the mean absolute difference of a downscaled
+grayscale image ('diff', threshold in grey levels 0-255) or the Hamming distance between 64-bit
+difference hashes ('hash', threshold in bits). Fixed-camera footage is mostly static, so most
+frames can reuse the results of the last frame that was actually sent.
+"""
+
+import cv2
+import numpy as np
+
+
+class ChangeDetector:
+    def __init__(self, threshold=3.0, method='diff', size=32):
+        if method not in ('diff', 'hash'):
+            raise ValueError(f"Invalid method: '{method}' not found. Please choose 'diff' or 'hash'.")
+        self.threshold = threshold
+        self.method = method
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        self.reference = None
+        self.submitted = 0
+        self.skipped = 0
+
+    def _signature(self, frame):
+        if self.method == 'diff':
+            small = cv2.resize(frame, (self.size, self.size), interpolation=cv2.INTER_AREA)
+            return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+        small = cv2.resize(frame, (9, 8), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return gray[:, 1:] > gray[:, :-1]
+
+    def _distance(self, a, b):
+        if self.method == 'diff':
+            return float(np.abs(a - b).mean())
+        return int(np.count_nonzero(a != b))
+
+    # True when the frame differs enough from the last submitted frame to be uploaded
+    def should_submit(self, frame):
+        signature = self._signature(frame)
+        if self.reference is not None and self._distance(signature, self.reference) <= self.threshold:
+            self.skipped += 1
+            return False
+        self.reference = signature
+        self.submitted += 1
+        return True
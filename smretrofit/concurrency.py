@@ -0,0 +1,164 @@
+"""
+Adaptive concurrency control for uploads, driven by server feedback.
+
+AdaptiveLimiter bounds how many requests are in flight with an AIMD controller: the limit grows by
+about one request per window of successful responses and is cut multiplicatively on 429, 5xx,
+timeouts, or when the smoothed latency rises well above the best latency observed (requests are
+queueing on the server). Retry-After pauses new requests until the server is ready again, and an
+optional request budget per second caps throughput outright. Clients sharing a credential can
+share one limiter, so together they converge to what the service sustains for that account.
+"""
+
+import asyncio
+import threading
+import time
+
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class AdaptiveLimiter:
+    def __init__(self, initial=4, maximum=32, minimum=1, backoff=0.5, tolerance=2.0, rate=None):
+        if not 1 <= minimum <= initial <= maximum:
+            raise ValueError(f"Invalid limits: expected 1 <= minimum ({minimum}) <= initial ({initial}) "
+                             f"<= maximum ({maximum}).")
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum      # Ceiling on requests in flight
+        self.backoff = backoff      # Multiplicative decrease on congestion
+        self.tolerance = tolerance  # Latency above tolerance x baseline counts as congestion
+        self.rate = rate            # Optional budget in requests per second
+        self.in_flight = 0
+        self.latency = None         # Smoothed latency of successful requests
+        self.baseline = None        # Best smoothed latency, drifting slowly upwards
+        self.paused_until = 0.0
+        self._tokens = float(max(1.0, rate or 1.0))
+        self._refilled = time.monotonic()
+        self._last_decrease = 0.0
+        self._lock = threading.Condition()
+        self._waiters = []          # (loop, future) of coroutines waiting for a slot
+
+    # Pickled as its settings; every copy adapts on its own, so worker processes get a split() of it
+    def __reduce__(self):
+        return AdaptiveLimiter, (int(self.limit), self.maximum, self.minimum, self.backoff, self.tolerance, self.rate)
+
+    # A limiter for one of `parts` processes sharing this one's budget: the ceiling and request rate are split
+    def split(self, parts):
+        maximum = max(self.minimum, self.maximum // parts)
+        initial = max(self.minimum, min(int(self.limit), maximum))
+        rate = self.rate / parts if self.rate else None
+        return AdaptiveLimiter(initial, maximum, self.minimum, self.backoff, self.tolerance, rate)
+
+    # Claim a slot if one is free; returns (claimed, seconds to wait or None to wait for a release)
+    def _reserve(self):
+        now = time.monotonic()
+        if now < self.paused_until:
+            return False, self.paused_until - now
+        if self.in_flight >= int(self.limit):
+            return False, None
+        if self.rate:
+            self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._refilled) * self.rate)
+            self._refilled = now
+            if self._tokens < 1.0:
+                return False, (1.0 - self._tokens) / self.rate
+            self._tokens -= 1.0
+        self.in_flight += 1
+        return True, None
+
+    def acquire(self):
+        with self._lock:
+            while True:
+                claimed, wait = self._reserve()
+                if claimed:
+                    return
+                self._lock.wait(wait)
+
+    # One future is registered per waiting coroutine; it is replaced only after a release() has woken it
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        future = None
+        try:
+            while True:
+                with self._lock:
+                    claimed, wait = self._reserve()
+                    if claimed:
+                        return
+                    if future is None or future.done():
+                        future = loop.create_future()
+                        self._waiters.append((loop, future))
+                await asyncio.wait([future], timeout=wait)
+        finally:
+            # A waiter that got its slot, timed out of the pause or was cancelled leaves no entry behind
+            if future is not None and not future.done():
+                with self._lock:
+                    if (loop, future) in self._waiters:
+                        self._waiters.remove((loop, future))
+
+    # Report how a request went: latency in seconds, HTTP status (None for connection errors and
+    # timeouts) and the Retry-After header if the server sent one
+    def release(self, latency=None, status=200, retry_after=None):
+        with self._lock:
+            self.in_flight -= 1
+            self._update(latency, status, retry_after)
+            self._lock.notify_all()
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def _update(self, latency, status, retry_after):
+        now = time.monotonic()
+        if status is None or status in RETRY_STATUS_CODES:
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+            self._decrease(now)
+            return
+        if latency is None or status != 200:
+            return
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        if self.baseline is None or self.latency < self.baseline:
+            self.baseline = self.latency
+        else:
+            self.baseline += (self.latency - self.baseline) * 0.01  # Let a slower service reset the baseline
+        if self.latency > self.tolerance * self.baseline:
+            self._decrease(now)
+        else:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    # At most one cut per round trip, so a burst of errors from one window counts once
+    def _decrease(self, now):
+        if now - self._last_decrease < (self.latency or 0.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * self.backoff)
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+# One limiter per endpoint and credential in this process, created with the given options on first use.
+# Later callers must pass the same options (or none), since they get the existing limiter.
+def shared_limiter(url, auth_key, **options):
+    with _shared_lock:
+        key = (url, auth_key)
+        if key not in _shared:
+            _shared[key] = AdaptiveLimiter(**options), options
+        limiter, first_options = _shared[key]
+        if options and options != first_options:
+            raise ValueError(f"A shared limiter for '{url}' already exists with options {first_options}; "
+                             f"got {options}.")
+        return limiter
+
+
+# Parse a Retry-After header given in seconds; HTTP dates are ignored
+def retry_after_seconds(value):
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
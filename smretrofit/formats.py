@@ -0,0 +1,77 @@
+"""
+File type detection from magic bytes.
+
+Images are recognised from the first bytes of the file before the whole file is read for upload,
+so other files are rejected without loading them. Videos are recognised by probing the container header (ISO BMFF/QuickTime,
+AVI, Matroska/WebM, MPEG program and transport streams, FLV, ASF) rather than trusting the file
+extension.
+"""
+
+
+# Bytes needed to recognise any supported container; MPEG-TS needs two 188-byte packets
+HEADER_SIZE = 512
+
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+    (b'II*\x00', 'tiff'),
+    (b'MM\x00*', 'tiff'),
+    (b'\x00\x00\x00\x0cjP  \r\n\x87\n', 'jp2'),
+    (b'\x00\x00\x01\x00', 'ico'),
+)
+
+# Netpbm P1-P6 (PBM, PGM, PPM in plain and raw form): the magic number is followed by whitespace
+PNM_MAGIC = (b'P1', b'P2', b'P3', b'P4', b'P5', b'P6')
+
+VIDEO_SIGNATURES = (
+    (b'\x1a\x45\xdf\xa3', 'matroska'),
+    (b'\x00\x00\x01\xba', 'mpeg'),
+    (b'\x00\x00\x01\xb3', 'mpeg'),
+    (b'FLV\x01', 'flv'),
+    (b'\x30\x26\xb2\x75\x8e\x66\xcf\x11', 'asf'),
+)
+
+# Top-level atoms a QuickTime/MP4 file may start with
+ISO_BMFF_ATOMS = (b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip', b'pnot')
+
+# ftyp major brands of ISO BMFF files that are not videos: HEIF/AVIF images and MPEG-4 audio
+NON_VIDEO_BRANDS = (b'heic', b'heix', b'heim', b'heis', b'hevc', b'hevx', b'hevm', b'hevs', b'mif1', b'msf1',
+                    b'avif', b'avis', b'M4A ', b'M4B ', b'M4P ', b'F4A ', b'F4B ')
+
+MPEG_TS_PACKET = 188
+
+
+def image_format(data):
+    header = bytes(data[:16])
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    for signature, name in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return name
+    if header[:2] in PNM_MAGIC and header[2:3].isspace():
+        return 'pnm'
+    return None
+
+
+def video_format(data):
+    header = bytes(data[:HEADER_SIZE])
+    if header[4:8] in ISO_BMFF_ATOMS:
+        if header[4:8] == b'ftyp' and header[8:12] in NON_VIDEO_BRANDS:
+            return None
+        return 'mp4'
+    if header[:4] == b'RIFF' and header[8:12] == b'AVI ':
+        return 'avi'
+    for signature, name in VIDEO_SIGNATURES:
+        if header.startswith(signature):
+            return name
+    if len(header) > MPEG_TS_PACKET and header[0] == header[MPEG_TS_PACKET] == 0x47:
+        return 'mpegts'
+    return None
+
+
+def read_header(file_path, size=HEADER_SIZE):
+    with open(file_path, 'rb') as f:
+        return f.read(size)
@@ -0,0 +1,81 @@
+"""
+Background video decoding into a ring of reusable frame buffers.
+
+FrameProducer reads frames from a cv2.VideoCapture on its own thread and hands them over through a
+bounded queue, so decoding overlaps uploads and annotation on the consumer side. Frames are decoded
+into a fixed set of buffers that go back to the ring when the consumer releases them, so once the
+ring is full, steady-state decoding allocates no new frame arrays. Frames the consumer does not need
+pixels for (already journaled, for example) are only grabbed, not decoded.
+"""
+
+import queue
+import threading
+
+from .metrics import NO_METRICS
+
+
+# Decoded frames kept beyond the upload window, so decoding can run ahead of the consumer
+RING_SLACK = 4
+
+_END = object()
+
+
+class FrameProducer:
+    def __init__(self, cap, size, start=0, stop=None, skip=None, metrics=NO_METRICS):
+        self.cap = cap
+        self.size = size
+        self.start = start
+        self.stop = stop
+        self.skip = skip          # skip(frame_index) -> True to grab the frame without decoding it
+        self.metrics = metrics
+        self._free = queue.Queue()
+        for _ in range(size):
+            self._free.put(None)  # Buffers are allocated by the first decodes and reused afterwards
+        self._ready = queue.Queue()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='smretrofit-decode', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        index = self.start
+        try:
+            while not self._closed.is_set() and (self.stop is None or index < self.stop):
+                buffer = self._free.get()
+                if self._closed.is_set():
+                    break
+                with self.metrics.timer('decode'):
+                    if self.skip is not None and self.skip(index + 1):
+                        self._free.put(buffer)
+                        ret, frame = self.cap.grab(), None
+                    elif buffer is None:
+                        ret, frame = self.cap.read()
+                    else:
+                        ret, frame = self.cap.read(buffer)  # Decodes in place when the size matches
+                if not ret:
+                    break
+                index += 1
+                self._ready.put((index, frame))
+        except Exception as e:
+            self._ready.put(e)
+        finally:
+            self._ready.put(_END)
+
+    # Next (frame_index, frame) in order, or None at the end of the video. frame is None for skipped frames.
+    def next(self):
+        item = self._ready.get()
+        if item is _END:
+            self._ready.put(_END)  # Stay at the end for repeated calls
+            return None
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    # Return a frame's buffer to the ring once the consumer is done with it
+    def release(self, frame):
+        if frame is not None:
+            self._free.put(frame)
+
+    def close(self):
+        self._closed.set()
+        self._free.put(None)  # Wake the producer if it is waiting for a buffer
+        self._thread.join()
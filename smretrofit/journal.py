@@ -0,0 +1,70 @@
+"""
+Append-only per-frame result journal for resumable video jobs.
+
+Every frame whose results come back is appended to a JSON Lines file as soon as it is parsed, so a
+job that dies part-way (network failure, OOM, kill) can be resumed: frames already in the journal
+are served from it instead of being uploaded again. The first line identifies the video and frame
+range the journal belongs to; a torn last line left by a crash is discarded on load.
+"""
+
+import json
+import os
+
+
+class Journal:
+    def __init__(self, path, file_path, start=0, stop=None):
+        self.path = path
+        self.records = {}
+        # Name, size and modification time: a video re-encoded or edited in place is not resumed with stale results
+        stat = os.stat(file_path)
+        header = {'video': os.path.basename(file_path), 'size': stat.st_size, 'mtime': stat.st_mtime,
+                  'start': start, 'stop': stop}
+        if os.path.exists(path):
+            self._load(header)
+            self._file = open(path, 'a')
+        else:
+            self._file = open(path, 'w')
+            self._write(header)
+
+    def _load(self, header):
+        valid = 0  # Byte offset just past the last complete record
+        with open(self.path, 'rb') as f:
+            for number, line in enumerate(f):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # Torn write from an interrupted run
+                if not line.endswith(b'\n'):
+                    break
+                if number == 0:
+                    if record != header:
+                        raise ValueError(f"The journal '{self.path}' belongs to a different video or frame range.")
+                else:
+                    self.records[record['frame']] = record['results']
+                valid += len(line)
+        if valid == 0:
+            raise ValueError(f"The journal '{self.path}' is empty or corrupted.")
+        with open(self.path, 'r+b') as f:
+            f.truncate(valid)
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()  # Survives the process being killed; fsync per frame would cost too much
+
+    def get(self, index):
+        return self.records.get(index)
+
+    def record(self, index, results):
+        self.records[index] = results
+        self._write({'frame': index, 'results': results})
+
+    def __len__(self):
+        return len(self.records)
+
+    def close(self):
+        self._file.close()
+
+    # The job finished: the journal is no longer needed
+    def remove(self):
+        self.close()
+        os.remove(self.path)
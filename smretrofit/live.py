@@ -0,0 +1,125 @@
+"""
+Live stream ingest with bounded latency.
+
+A live source (a camera index, an RTSP/HTTP URL, a GStreamer pipeline or any cv2.VideoCapture) produces
+frames at its own pace whether or not the uploads keep up. LatestFrame reads the source on its own thread
+and keeps only the newest frame, so whenever an upload slot frees up the freshest frame is sent and the
+frames captured in the meantime are dropped instead of queueing: latency stays bounded by the round trip
+rather than growing with a backlog. Files can be replayed at their frame rate to test a live setup
+locally. RollingRecorder writes annotated frames into fixed-length segments and keeps the newest ones.
+"""
+
+from collections import deque
+import os
+import threading
+import time
+import cv2
+
+from .metrics import NO_METRICS
+
+
+# Frame rate assumed for recordings when the source does not report one
+DEFAULT_FPS = 25.0
+
+
+class LatestFrame:
+    def __init__(self, cap, realtime=False, metrics=NO_METRICS):
+        self.cap = cap
+        self.realtime = realtime  # Pace reads at the source frame rate, e.g. to replay a file as if it were live
+        self.metrics = metrics
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        self.started = time.perf_counter()
+        self.ended = False
+        self.error = None
+        self._latest = None       # (frame_index, capture time, frame)
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='smretrofit-capture', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        index = 0
+        try:
+            while not self._closed:
+                if self.realtime and self.fps:
+                    delay = self.started + index / self.fps - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                with self.metrics.timer('capture'):  # Includes waiting for the camera
+                    ret, frame = self.cap.read()
+                if not ret:
+                    break  # End of file, or the stream went away
+                index += 1
+                self.metrics.count('captured')
+                with self._condition:
+                    self._latest = (index, time.perf_counter(), frame)
+                    self._condition.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            with self._condition:
+                self.ended = True
+                self._condition.notify_all()
+
+    def _newer(self, after):
+        return self._latest is not None and self._latest[0] > after
+
+    # The newest (frame_index, capture time, frame) captured after frame `after`. Waits for one unless the
+    # source has ended or until() becomes true (re-checked on notify()), in which case it returns None.
+    def next(self, after, until=None):
+        with self._condition:
+            self._condition.wait_for(lambda: self._newer(after) or self.ended or (until is not None and until()))
+            if self._newer(after):
+                return self._latest
+            if self.error is not None:
+                raise self.error
+            return None
+
+    # Wake a waiting next() so it re-checks its until() condition
+    def notify(self):
+        with self._condition:
+            self._condition.notify_all()
+
+    def close(self):
+        self._closed = True
+        self._thread.join()
+
+
+class RollingRecorder:
+    def __init__(self, output, fps, segment_seconds=60, keep_segments=None, prefix='stream'):
+        self.output = output
+        self.fps = fps or DEFAULT_FPS
+        self.segment_frames = max(1, int(round(segment_seconds * self.fps)))
+        self.keep_segments = keep_segments  # None keeps every segment
+        self.prefix = prefix
+        self.paths = deque()
+        self._writer = None
+        self._written = 0
+        self._segment = 0
+        self._last_index = None
+
+    # Frames dropped since the last write are filled with this one, so recordings play back in real time
+    def write(self, frame, frame_index):
+        repeats = 1 if self._last_index is None else max(1, frame_index - self._last_index)
+        self._last_index = frame_index
+        for _ in range(repeats):
+            if self._writer is None or self._written >= self.segment_frames:
+                self._rotate(frame.shape[1], frame.shape[0])
+            self._writer.write(frame)
+            self._written += 1
+
+    def _rotate(self, width, height):
+        if self._writer is not None:
+            self._writer.release()
+        self._segment += 1
+        path = os.path.join(self.output, f'{self.prefix}_{self._segment:05d}.mp4')
+        self._writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), self.fps, (width, height))
+        self._written = 0
+        self.paths.append(path)
+        while self.keep_segments is not None and len(self.paths) > self.keep_segments:
+            os.remove(self.paths.popleft())
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
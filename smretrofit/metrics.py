@@ -0,0 +1,194 @@
+"""
+Per-stage timing and counters for profiling Retrofit runs.
+
+Every run records how long each stage takes (read, decode, encode, upload, parse, render, write) in a
+log-bucketed latency histogram, along with counters such as frames, uploads, bytes uploaded,
+retries and cache hits. Hooks receive stage timings, progress updates and the final Summary, so
+production runs can be profiled without patching the library. ProgressPrinter is the default
+hook and prints the familiar progress line.
+"""
+
+from collections import defaultdict
+from contextlib import contextmanager
+import math
+import threading
+import time
+
+
+# Histogram buckets: 10 per decade starting at 10 microseconds
+HISTOGRAM_MIN = 1e-5
+BUCKETS_PER_DECADE = 10
+BUCKETS = 80
+
+
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (BUCKETS + 1)
+
+    def add(self, seconds):
+        if seconds <= HISTOGRAM_MIN:
+            index = 0
+        else:
+            index = min(BUCKETS, int(math.log10(seconds / HISTOGRAM_MIN) * BUCKETS_PER_DECADE) + 1)
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+
+    # Upper bound of the bucket holding the q-th percentile, capped at the largest observation
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(self.max, HISTOGRAM_MIN * 10 ** (index / BUCKETS_PER_DECADE))
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+
+class Summary:
+    def __init__(self, elapsed, stages, counters):
+        self.elapsed = elapsed
+        self.stages = stages        # stage -> {'count', 'total', 'mean', 'p50', 'p99', 'max'} in seconds
+        self.counters = counters    # name -> value
+        frames = counters.get('frames', 0)
+        self.frames_per_second = frames / elapsed if elapsed else 0.0
+
+    def as_dict(self):
+        return {'elapsed': self.elapsed, 'frames_per_second': self.frames_per_second,
+                'stages': self.stages, 'counters': self.counters}
+
+    def __repr__(self):
+        stages = ', '.join(f"{stage}={values['mean'] * 1000:.1f}ms" for stage, values in self.stages.items())
+        return f'Summary(elapsed={self.elapsed:.2f}s, fps={self.frames_per_second:.1f}, {stages})'
+
+
+class MetricsHook:
+    def on_stage(self, stage, seconds):
+        pass
+
+    def on_progress(self, done, total):
+        pass
+
+    def on_finish(self, summary):
+        pass
+
+
+class ProgressPrinter(MetricsHook):
+    def __init__(self):
+        self._printed = False
+
+    def on_progress(self, done, total):
+        self._printed = True
+        print(f'\rProcessing: {done / max(1, total) * 100:.2f}%', end='')  # Print on the same line
+
+    def on_finish(self, summary):
+        if self._printed:
+            print()
+            self._printed = False
+        skipped = summary.counters.get('skipped', 0)
+        if skipped:
+            print(f"Skipped {skipped} of {summary.counters.get('frames', 0)} uploads (similar frames)")
+        dropped = summary.counters.get('dropped', 0)
+        if dropped:
+            print(f"Dropped {dropped} of {summary.counters.get('frames', 0)} frames (failed requests)")
+        stale = summary.counters.get('stale', 0)
+        if stale:
+            print(f"Dropped {stale} of {summary.counters.get('captured', 0)} captured frames (stale)")
+
+
+class Metrics:
+    def __init__(self, hooks=()):
+        self.hooks = list(hooks)
+        self.stages = {}
+        self.counters = defaultdict(int)
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            if stage not in self.stages:
+                self.stages[stage] = Histogram()
+            self.stages[stage].add(seconds)
+        for hook in self.hooks:
+            hook.on_stage(stage, seconds)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    # Fold in stage histograms and counters recorded elsewhere, e.g. by worker processes
+    def merge(self, stages, counters):
+        with self._lock:
+            for stage, histogram in stages.items():
+                self.stages.setdefault(stage, Histogram()).merge(histogram)
+            for name, value in counters.items():
+                self.counters[name] += value
+
+    def progress(self, done, total):
+        for hook in self.hooks:
+            hook.on_progress(done, total)
+
+    def summary(self):
+        with self._lock:
+            stages = {stage: histogram.as_dict() for stage, histogram in self.stages.items()}
+            counters = dict(self.counters)
+        return Summary(time.perf_counter() - self._start, stages, counters)
+
+    def finish(self):
+        summary = self.summary()
+        for hook in self.hooks:
+            hook.on_finish(summary)
+        return summary
+
+
+class NullMetrics(Metrics):
+    # Records nothing; used when a helper is called outside of a measured run
+
+    @contextmanager
+    def timer(self, stage):
+        yield
+
+    def observe(self, stage, seconds):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+    def merge(self, stages, counters):
+        pass
+
+    def progress(self, done, total):
+        pass
+
+
+NO_METRICS = NullMetrics()
@@ -0,0 +1,47 @@
+"""
+Multipart upload bodies that reference the payload instead of copying it.
+
+requests builds multipart bodies by writing every part into one new buffer, so an encoded frame is
+copied on its way to the socket. MultipartBody instead yields the form fields, a memoryview of the
+encoded array and the closing boundary as separate chunks with a known Content-Length, so the frame
+is sent straight from the memory cv2.imencode wrote it to. The body can be iterated again when a
+request is retried.
+"""
+
+import binascii
+import os
+
+
+# Escaping urllib3 applies to Content-Disposition parameters (HTML5 form encoding): quotes, backslashes
+# and control characters other than ESC
+_HTML5_REPLACEMENTS = {'"': '%22', '\\': '\\\\'}
+_HTML5_REPLACEMENTS.update({chr(cc): f'%{cc:02X}' for cc in range(0x20) if cc != 0x1B})
+
+
+def _quote(value):
+    return ''.join(_HTML5_REPLACEMENTS.get(char, char) for char in str(value))
+
+
+class MultipartBody:
+    def __init__(self, fields, filename, data):
+        self.boundary = binascii.hexlify(os.urandom(16)).decode('ascii')
+        head = []
+        for name, value in fields.items():
+            head.append(f'--{self.boundary}\r\nContent-Disposition: form-data; name="{_quote(name)}"\r\n\r\n{value}\r\n')
+        head.append(f'--{self.boundary}\r\nContent-Disposition: form-data; name="file"; '
+                    f'filename="{_quote(filename)}"\r\n\r\n')
+        self._head = ''.join(head).encode('utf-8')
+        self._data = memoryview(data).cast('B')  # Flat byte view; no copy for contiguous buffers
+        self._tail = f'\r\n--{self.boundary}--\r\n'.encode('ascii')
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return len(self._head) + self._data.nbytes + len(self._tail)
+
+    def __iter__(self):
+        yield self._head
+        yield self._data
+        yield self._tail
@@ -0,0 +1,162 @@
+"""
+Annotation renderer shared by the image and video paths.
+
+Everything that only depends on the class vocabulary and the frame size is computed once and
+cached: the label rows (which defect and rating labels are shown together, and in which colors),
+the text metrics and the resulting label layout. Per frame, only the boxes and labels are drawn,
+in place on the BGR frame.
+"""
+
+import cv2
+import numpy as np
+
+
+# Box and label colors in BGR order, since frames are annotated as decoded by OpenCV
+DEFECT_COLORS = {
+    0: (0, 0, 255),      # Corrosion: Red
+    1: (0, 255, 0),      # Crack: Green
+    2: (255, 0, 0),      # Abnormal Spacing: Blue
+    3: (0, 165, 255),    # Functional Disorder of Bearing: Orange
+    4: (128, 0, 128),    # Spalling/Exposed Rebar: Purple
+}
+
+RATING_COLORS = {
+    0: (64, 15, 95),     # Corrosion_Dt: Dark Magenta (#5F0F40)
+    1: (255, 255, 0),    # Crack_Ct: Cyan (#00FFFF)
+    2: (255, 255, 0),    # Abnormal Spacing_Ct: Cyan (#00FFFF)
+    3: (255, 255, 0),    # Functional Disorder of Bearing_Ct: Cyan (#00FFFF)
+    4: (255, 255, 0),    # Spalling/Exposed Rebar_Ct: Cyan (#00FFFF)
+    5: (255, 255, 0),    # Corrosion_Ct: Cyan (#00FFFF)
+    6: (64, 15, 95),     # Crack_Dt: Dark Magenta (#5F0F40)
+    7: (255, 255, 255),  # Abnormal Spacing_Bt: White (#FFFFFF)
+    8: (255, 255, 255),  # Functional Disorder of Bearing_Bt: White (#FFFFFF)
+    9: (255, 255, 255),  # Spalling/Exposed Rebar_Bt: White (#FFFFFF)
+}
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+# Each cache is cleared once it holds this many entries
+CACHE_LIMIT = 1024
+
+
+class Renderer:
+    def __init__(self, detect_mode="all", label_mode="all", font_size=7, font_thickness=3, line_space=10,
+                 label_map=None):
+        if detect_mode not in ('all', 'defect', 'rating'):
+            raise ValueError(f"Invalid mode: '{detect_mode}' not found. Please choose 'all' or 'defect' or 'rating'.")
+        if label_mode not in ('all', 'defect', 'rating'):
+            raise ValueError(f"Invalid mode: '{label_mode}' not found. Please choose 'all' or 'defect', 'rating'.")
+        self.detect_mode = detect_mode
+        self.label_mode = label_mode
+        self.font_size = font_size
+        self.font_thickness = font_thickness
+        self.line_space = line_space
+        # Rating label -> defect label it belongs to
+        self.reverse_label_map = {v: k for k, values in (label_map or {}).items() for v in values}
+        self._rows = {}
+        self._layouts = {}
+        self._text_sizes = {}
+
+    # Draw API results (the 'data'/'cls' dicts) on a BGR frame in place
+    def render(self, frame, defect_results, rating_results):
+        defect_boxes, defect_classes = self._arrays(defect_results['data'])
+        rating_boxes, rating_classes = self._arrays(rating_results['data'])
+        return self.draw(frame, defect_boxes, defect_classes, rating_boxes, rating_classes,
+                         defect_results['cls'], rating_results['cls'])
+
+    # Draw (N, 4) xyxy box arrays with their class ids; *_names map str(class id) to the class name
+    def draw(self, frame, defect_boxes, defect_classes, rating_boxes, rating_classes, defect_names, rating_names):
+        if self.detect_mode in ('all', 'defect'):
+            self._draw_boxes(frame, defect_boxes, defect_classes, DEFECT_COLORS, 40)
+        if self.detect_mode in ('all', 'rating'):
+            self._draw_boxes(frame, rating_boxes, rating_classes, RATING_COLORS, 45)
+
+        height, width = frame.shape[:2]
+        rows = self._label_rows(defect_classes, rating_classes, defect_names, rating_names)
+        font_scale, labels = self._layout(rows, height, width)
+        for label, origin, color in labels:
+            cv2.putText(frame, label, origin, FONT, font_scale, color, self.font_thickness)
+        return frame
+
+    def _arrays(self, data):
+        if not data:
+            return np.empty((0, 4)), np.empty(0, dtype=np.int64)
+        boxes = np.array([item['box_xyxy'] for item in data], dtype=np.float64)
+        classes = np.array([item['box_cls'] for item in data], dtype=np.int64)
+        return boxes, classes
+
+    def _draw_boxes(self, frame, boxes, classes, colors, divisor):
+        if not len(boxes):
+            return
+        boxes = np.asarray(boxes).astype(np.int64)
+        sizes = np.minimum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1])
+        # Line thickness grows with the box size
+        thicknesses = np.maximum(2, (sizes / divisor).astype(np.int64))
+        for (x1, y1, x2, y2), cls, thickness in zip(boxes.tolist(), np.asarray(classes).tolist(), thicknesses.tolist()):
+            cv2.rectangle(frame, (x1, y1), (x2, y2), colors.get(cls), thickness)
+
+    # One row per detected defect class (in order of appearance): the defect label followed by the
+    # labels of detected ratings that belong to it, each with its color
+    def _label_rows(self, defect_classes, rating_classes, defect_names, rating_names):
+        defect_order = tuple(dict.fromkeys(np.asarray(defect_classes).tolist()))
+        rating_present = tuple(sorted(set(np.asarray(rating_classes).tolist())))
+        key = (defect_order, rating_present, tuple(defect_names.items()), tuple(rating_names.items()))
+        rows = self._rows.get(key)
+        if rows is None:
+            rows = []
+            for cls in defect_order:
+                defect_name = defect_names.get(str(cls))
+                row = []
+                if self.label_mode != 'rating' and defect_name is not None:
+                    row.append((defect_name, DEFECT_COLORS.get(cls)))
+                if self.label_mode != 'defect':
+                    ratings = sorted((rating_names.get(str(r)), r) for r in rating_present
+                                     if self.reverse_label_map.get(rating_names.get(str(r))) == defect_name)
+                    row.extend((name, RATING_COLORS.get(r)) for name, r in ratings)
+                rows.append(tuple(row))
+            rows = tuple(rows)
+            self._remember(self._rows, key, rows)
+        return rows
+
+    # Label positions for a set of rows on a frame of the given size, right-aligned from the top corner
+    def _layout(self, rows, height, width):
+        key = (rows, height, width)
+        layout = self._layouts.get(key)
+        if layout is None:
+            # Font size is proportional to the frame height
+            font_scale = height / (70 * max(1, int(20 - self.font_size)))
+            max_label_width = 0
+            for row in rows:
+                (text_width, _), _ = self._text_size(" ".join(label for label, _ in row), font_scale)
+                max_label_width = max(max_label_width, text_width)
+
+            start_x, start_y = width - max_label_width - 30, 30
+            labels = []
+            for row in rows:
+                label_x = start_x + 10
+                total_text_height = 0
+                for label, color in row:
+                    (text_width, text_height), _ = self._text_size(label, font_scale)
+                    # Ensure label stays within image bounds
+                    if start_y + text_height + 10 > height:
+                        break
+                    labels.append((label, (label_x, start_y + text_height), color))
+                    label_x += text_width + 10  # Slight gap between defect and rating labels
+                    total_text_height = text_height
+                start_y += total_text_height + self.line_space
+            layout = (font_scale, tuple(labels))
+            self._remember(self._layouts, key, layout)
+        return layout
+
+    def _text_size(self, text, font_scale):
+        key = (text, font_scale)
+        size = self._text_sizes.get(key)
+        if size is None:
+            size = cv2.getTextSize(text, FONT, font_scale, self.font_thickness)
+            self._remember(self._text_sizes, key, size)
+        return size
+
+    def _remember(self, cache, key, value):
+        if len(cache) >= CACHE_LIMIT:
+            cache.clear()
+        cache[key] = value
@@ -0,0 +1,204 @@
+"""
+Compact, array-backed detection results.
+
+Each model's detections for a frame are stored as NumPy arrays (boxes, classes, scores) instead
+of lists of dicts, and a whole video is kept as one columnar, frame-indexed table that can be
+saved to .npz or Parquet for vectorized analytics.
+"""
+
+import json
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # Optional dependency: pip install smretrofit[fast]
+    orjson = None
+
+
+# Key holding the confidence score of each detection in the API results
+SCORE_KEY = 'box_conf'
+
+MODELS = ('defect', 'rating')
+
+# Frames buffered before they are consolidated into one block of arrays
+CHUNK_FRAMES = 1024
+
+
+# Parse a JSON response body (bytes or str), with orjson when it is installed
+def loads(body):
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+class Detections:
+    def __init__(self, boxes, classes, scores, names):
+        self.boxes = boxes      # (N, 4) float32 xyxy
+        self.classes = classes  # (N,) int32
+        self.scores = scores    # (N,) float32, NaN when the API sent no score
+        self.names = names      # str(class id) -> class name
+
+    @classmethod
+    def from_dict(cls, model_results):
+        data = model_results['data']
+        boxes = np.empty((len(data), 4), dtype=np.float32)
+        classes = np.empty(len(data), dtype=np.int32)
+        scores = np.empty(len(data), dtype=np.float32)
+        for i, item in enumerate(data):
+            boxes[i] = item['box_xyxy']
+            classes[i] = item['box_cls']
+            scores[i] = item.get(SCORE_KEY, np.nan)
+        return cls(boxes, classes, scores, dict(model_results['cls']))
+
+    # Back to the API's nested shape
+    def to_dict(self):
+        data = []
+        for box, cls, score in zip(self.boxes.tolist(), self.classes.tolist(), self.scores.tolist()):
+            item = {'box_xyxy': box, 'box_cls': cls}
+            if score == score:  # Not NaN
+                item[SCORE_KEY] = score
+            data.append(item)
+        return {'data': data, 'cls': dict(self.names)}
+
+    def __len__(self):
+        return len(self.classes)
+
+
+class FrameResult:
+    def __init__(self, defect, rating, frame_index=None, timestamp=None, tracked=False):
+        self.defect = defect
+        self.rating = rating
+        self.frame_index = frame_index
+        self.timestamp = timestamp
+        self.tracked = tracked  # Boxes carried over from a keyframe rather than returned by the API
+
+    @classmethod
+    def from_results(cls, results, frame_index=None, timestamp=None):
+        return cls(Detections.from_dict(results[0]), Detections.from_dict(results[1]), frame_index, timestamp,
+                   results[0].get('source') == 'tracked')
+
+    def to_results(self):
+        return [self.defect.to_dict(), self.rating.to_dict()]
+
+    # Annotate a BGR frame in place with a Renderer
+    def draw(self, renderer, frame):
+        return renderer.draw(frame, self.defect.boxes, self.defect.classes, self.rating.boxes, self.rating.classes,
+                             self.defect.names, self.rating.names)
+
+
+class VideoResults:
+    def __init__(self):
+        self.names = {model: {} for model in MODELS}
+        self._chunks = []
+        self._pending = []
+
+    def append(self, frame_result):
+        block = {
+            'frame_index': np.array([frame_result.frame_index], dtype=np.int64),
+            'timestamp': np.array([frame_result.timestamp], dtype=np.float64),
+            'tracked': np.array([frame_result.tracked], dtype=bool),
+        }
+        for model in MODELS:
+            detections = getattr(frame_result, model)
+            self.names[model].update(detections.names)
+            block[f'{model}_frame'] = np.full(len(detections), frame_result.frame_index, dtype=np.int64)
+            block[f'{model}_boxes'] = detections.boxes
+            block[f'{model}_classes'] = detections.classes
+            block[f'{model}_scores'] = detections.scores
+        self._pending.append(block)
+        if len(self._pending) >= CHUNK_FRAMES:
+            self._chunks.append(self._concat(self._pending))
+            self._pending = []
+
+    def _concat(self, blocks):
+        return {key: np.concatenate([block[key] for block in blocks]) for key in blocks[0]}
+
+    # Column name -> array. Frame columns have one row per frame; '<model>_*' columns one row per detection.
+    def columns(self):
+        blocks = self._chunks + self._pending
+        if not blocks:
+            columns = {'frame_index': np.empty(0, np.int64), 'timestamp': np.empty(0, np.float64),
+                       'tracked': np.empty(0, bool)}
+            for model in MODELS:
+                columns[f'{model}_frame'] = np.empty(0, np.int64)
+                columns[f'{model}_boxes'] = np.empty((0, 4), np.float32)
+                columns[f'{model}_classes'] = np.empty(0, np.int32)
+                columns[f'{model}_scores'] = np.empty(0, np.float32)
+            return columns
+        # Consolidated once and kept: later calls return the same arrays until more frames are appended
+        if len(blocks) > 1 or self._pending:
+            self._chunks, self._pending = [self._concat(blocks)], []
+        return self._chunks[0]
+
+    def __len__(self):
+        return sum(len(block['frame_index']) for block in self._chunks + self._pending)
+
+    # Results of one frame, located by binary search on the frame-sorted columns
+    def frame(self, frame_index):
+        columns = self.columns()
+        position = np.searchsorted(columns['frame_index'], frame_index)
+        if position == len(columns['frame_index']) or columns['frame_index'][position] != frame_index:
+            raise KeyError(f"Frame {frame_index} has no results.")
+        bounds = [(np.searchsorted(columns[f'{model}_frame'], frame_index, 'left'),
+                   np.searchsorted(columns[f'{model}_frame'], frame_index, 'right')) for model in MODELS]
+        return self._frame_result(columns, position, bounds)
+
+    # FrameResult for row `position`, with each model's detections in rows [start, end) of its columns
+    def _frame_result(self, columns, position, bounds):
+        detections = [Detections(columns[f'{model}_boxes'][start:end], columns[f'{model}_classes'][start:end],
+                                 columns[f'{model}_scores'][start:end], self.names[model])
+                      for model, (start, end) in zip(MODELS, bounds)]
+        tracked = 'tracked' in columns and bool(columns['tracked'][position])  # Absent from older .npz files
+        return FrameResult(detections[0], detections[1], int(columns['frame_index'][position]),
+                           float(columns['timestamp'][position]), tracked)
+
+    # Detection offsets of every frame are found in one pass, so iterating is linear in the number of frames
+    def __iter__(self):
+        columns = self.columns()
+        frame_index = columns['frame_index']
+        offsets = [(np.searchsorted(columns[f'{model}_frame'], frame_index, 'left').tolist(),
+                    np.searchsorted(columns[f'{model}_frame'], frame_index, 'right').tolist()) for model in MODELS]
+        for position in range(len(frame_index)):
+            yield self._frame_result(columns, position,
+                                     [(starts[position], ends[position]) for starts, ends in offsets])
+
+    # Nested dict results, as returned by get_video_data with detect_mode='all'
+    def to_results(self):
+        return [frame_result.to_results() for frame_result in self]
+
+    def save_npz(self, path):
+        np.savez_compressed(path, names=np.array(json.dumps(self.names)), **self.columns())
+
+    @classmethod
+    def load_npz(cls, path):
+        video = cls()
+        with np.load(path) as data:
+            video.names = json.loads(str(data['names']))
+            video._chunks = [{key: data[key] for key in data.files if key != 'names'}]
+        return video
+
+    # One row per detection: frame_index, timestamp, tracked, model, class, name, score, x1, y1, x2, y2
+    def to_parquet(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("to_parquet requires pyarrow. Install it with 'pip install pyarrow'.")
+        columns = self.columns()
+        tables = []
+        for model in MODELS:
+            frames = columns[f'{model}_frame']
+            boxes = columns[f'{model}_boxes']
+            classes = columns[f'{model}_classes']
+            positions = np.searchsorted(columns['frame_index'], frames)
+            tables.append(pa.table({
+                'frame_index': frames,
+                'timestamp': columns['timestamp'][positions],
+                'tracked': columns['tracked'][positions] if 'tracked' in columns else np.zeros(len(frames), bool),
+                'model': pa.array([model] * len(frames), pa.string()),
+                'class': classes,
+                'name': pa.array([self.names[model].get(str(cls)) for cls in classes.tolist()], pa.string()),
+                'score': columns[f'{model}_scores'],
+                'x1': boxes[:, 0], 'y1': boxes[:, 1], 'x2': boxes[:, 2], 'y2': boxes[:, 3],
+            }))
+        pq.write_table(pa.concat_tables(tables), path)
@@ -0,0 +1,71 @@
+"""
+Multi-process sharded processing of long videos.
+
+A video is split into contiguous frame ranges, one per worker process. Sessions, caches and locks do
+not cross process boundaries, so each worker rebuilds its own client from the parent's settings and
+processes its range with the regular streaming pipeline, with its own capture, connection pool and
+segment writer. Results are merged back in frame order and the annotated segments are joined into
+the final output: losslessly with ffmpeg's concat demuxer when ffmpeg is installed, otherwise by
+re-encoding with OpenCV.
+"""
+
+import os
+import shutil
+import subprocess
+import cv2
+
+from .journal import Journal
+from .metrics import Metrics
+
+
+# Split frames [0, total_frames) into at most `shards` contiguous, near-equal ranges
+def shard_ranges(total_frames, shards):
+    shards = max(1, min(shards, total_frames))
+    bounds = [total_frames * i // shards for i in range(shards + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+# Runs in a worker process; returns the shard's (index, timestamp, results) records and its metrics
+def process_shard(cls, settings, label_map, file_path, start, stop, segment_path, max_in_flight, skip_similar,
+                  journal_path=None, track=None):
+    retrofit = cls(**settings)
+    retrofit.label_map = label_map
+    metrics = Metrics()
+    try:
+        detector = retrofit._change_detector(skip_similar)
+        tracker = retrofit._box_tracker(track, skip_similar)
+        journal = Journal(journal_path, file_path, start, stop) if journal_path else None
+        frames = retrofit._stream_video(file_path, segment_path, max_in_flight, detector, metrics, start, stop,
+                                        journal, tracker)
+        records = [(index, timestamp, results) for index, timestamp, results, _ in frames]
+    finally:
+        retrofit.close()
+    return records, metrics.stages, dict(metrics.counters)
+
+
+def concat_segments(segment_paths, output_path, fps, frame_size):
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg:
+        list_path = os.path.join(os.path.dirname(segment_paths[0]), 'segments.txt')
+        with open(list_path, 'w') as f:
+            for path in segment_paths:
+                f.write(f"file '{os.path.abspath(path)}'\n")
+        command = [ffmpeg, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', list_path,
+                   '-c', 'copy', output_path]
+        if subprocess.run(command).returncode == 0:
+            return
+    # No ffmpeg (or it failed): decode the segments and write them into one file
+    out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, frame_size)
+    try:
+        for path in segment_paths:
+            cap = cv2.VideoCapture(path)
+            try:
+                while True:
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    out.write(frame)
+            finally:
+                cap.release()
+    finally:
+        out.release()
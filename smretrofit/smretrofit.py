@@ -19,23 +19,58 @@ Usage: Ideal for industries such as manufacturing, quality control, and inspecti
 
 
 
-from collections import defaultdict
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import json
-import mimetypes
+import multiprocessing
 import os
 import pickle
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from PIL import Image
-import io
 import cv2
 import random
+import io
+import tempfile
+import threading
+import time
 import numpy as np
+from .cache import CachedResponse, ResultCache
+from .concurrency import AdaptiveLimiter, RETRY_STATUS_CODES, retry_after_seconds, shared_limiter
+from .change import ChangeDetector
+from .formats import image_format, read_header, video_format
+from .frames import FrameProducer, RING_SLACK
+from .journal import Journal
+from .live import LatestFrame, RollingRecorder
+from .renderer import Renderer
+from .results import FrameResult, VideoResults, loads
+from .metrics import Metrics, ProgressPrinter, NO_METRICS
+from .multipart import MultipartBody
+from .sharding import concat_segments, process_shard, shard_ranges
+from .tiling import merge_tiles, tile_windows
+from .tracking import BoxTracker
 # from cryptography.fernet import Fernet
 
 
+# Frame sampling strategies for get_video_data_sample
+SAMPLE_STRATEGIES = ('random', 'even', 'interval', 'keyframe')
+
+# Beyond this many frames it is cheaper to seek than to grab() frame by frame
+SEEK_GAP = 30
+
+# Upload encodings: file extension and the OpenCV quality flag
+UPLOAD_FORMATS = {
+    'jpg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY),
+    'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
 class Retrofit:
     def __init__(self, url="https://api.somikoron.ai/api/", auth_key="", auth_pass="",
-                  font_size=7, font_thickness=3, line_space=10, detect_mode="all", label_mode="all"):
+                  font_size=7, font_thickness=3, line_space=10, detect_mode="all", label_mode="all",
+                  pool_size=10, keep_alive=True, timeout=(10, 120), retries=3, backoff_factor=0.5, cache=None,
+                  max_side=None, max_pixels=None, image_format="jpg", quality=95, hooks=None, concurrency=None):
         self.url = url
         self.auth_key = auth_key
         self.auth_pass = auth_pass
@@ -45,7 +80,35 @@ class Retrofit:
         self.line_space = line_space
         self.detect_mode = detect_mode
         self.label_mode = label_mode
-
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        # Optional on-disk result cache: a ResultCache or a directory to keep one in
+        self.cache = ResultCache(cache) if isinstance(cache, str) else cache
+        # Client-side downscaling and encoding before upload; boxes are mapped back to full resolution
+        if image_format not in UPLOAD_FORMATS:
+            raise ValueError(f"Invalid image_format: '{image_format}' not found. Please choose 'jpg' or 'webp'.")
+        self.max_side = max_side
+        self.max_pixels = max_pixels
+        self.image_format = image_format
+        self.quality = quality
+        # Metrics hooks notified of stage timings, progress and the final summary of every run
+        self.hooks = [ProgressPrinter()] if hooks is None else list(hooks)
+        # Adaptive concurrency: an AdaptiveLimiter, or "adaptive" for one shared by every client with this credential
+        if concurrency == 'adaptive':
+            concurrency = shared_limiter(url, auth_key)
+        elif concurrency is not None and not isinstance(concurrency, AdaptiveLimiter):
+            raise ValueError(f"Invalid concurrency: '{concurrency}'. Please pass 'adaptive' or an AdaptiveLimiter.")
+        self.limiter = concurrency
+        # One pooled session is shared by every call so frames reuse the same TCP/TLS connections; with a limiter
+        # the pool holds as many connections as it can allow in flight
+        if self.limiter is not None:
+            pool_size = max(pool_size, self.limiter.maximum)
+        self.session = self._create_session(pool_size, keep_alive, retries, backoff_factor, self.limiter is None)
+        self._pool_maxsize = pool_size
+        self._pool_lock = threading.Lock()
 
         self.label_map = {
             "Corrosion": ["Corrosion_Ct", "Corrosion_Dt"],
@@ -54,165 +117,359 @@ class Retrofit:
             "Functional Disorder of Bearing": ["Functional Disorder of Bearing_Ct", "Functional Disorder of Bearing_Bt"],
             "Spalling/Exposed Rebar": ["Spalling/Exposed Rebar_Ct", "Spalling/Exposed Rebar_Bt"]
         }
-
-
-    
-
-    def get_video_data_sample(self, file_path, save=False, sample=3, output="output/", temp="temp/"):
-        if not os.path.exists(temp):
-            os.makedirs(temp)  # Create the temp directory if it doesn't exist
-
+        self._renderer = None
+        self._renderer_config = None
+
+
+
+    def _create_session(self, pool_size, keep_alive, retries, backoff_factor, retry_throttled=True):
+        # Retry connect errors, 429 and 5xx with exponential backoff (honouring Retry-After). With an adaptive
+        # limiter 429 is left to _post, so the limiter sees each throttled attempt and its Retry-After; urllib3
+        # retries any response carrying Retry-After when it honours the header, so the limiter handles that too.
+        status_forcelist = RETRY_STATUS_CODES if retry_throttled else tuple(c for c in RETRY_STATUS_CODES if c != 429)
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=status_forcelist,
+            allowed_methods=frozenset(['POST']),
+            respect_retry_after_header=retry_throttled,
+            raise_on_status=False,  # Hand the last response back instead of raising
+        )
+        session = requests.Session()
+        self._mount_adapter(session, pool_size, retry)
+        if not keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def _mount_adapter(self, session, pool_size, retry):
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+    # Grow the connection pool to hold `connections` concurrent uploads; a smaller pool would discard
+    # keep-alive connections after every request beyond its size
+    def _reserve_connections(self, connections):
+        with self._pool_lock:
+            if connections <= self._pool_maxsize:
+                return
+            retry = self.session.get_adapter(self.url).max_retries
+            self._mount_adapter(self.session, connections, retry)
+            self._pool_maxsize = connections
+
+    # Send one encoded image to the API through the shared session, serving repeats from the cache
+    # slot_held: the caller already claimed a limiter slot for the first attempt
+    def _post(self, data, filename='file', metrics=NO_METRICS, slot_held=False):
+        if self.cache is not None:
+            key = self.cache.key(self.url, data)
+            body = self.cache.get(key)
+            if body is not None:
+                metrics.count('cache_hits')
+                if slot_held:
+                    self.limiter.release()  # Nothing was sent; leaves the limit as it was
+                return CachedResponse(body)
+        # data may be bytes or an encoded array; either is sent from its own memory without copying
+        body = MultipartBody(self.credential, filename, data)
+        attempt = 0
+        with metrics.timer('upload'):
+            while True:
+                response = self._post_once(body, metrics, acquire=not slot_held or attempt > 0)
+                # With a limiter 429 is retried here instead of by urllib3, so its Retry-After reaches the limiter,
+                # which holds back this and every other request until then
+                if response.status_code != 429 or self.limiter is None or attempt >= self.retries:
+                    break
+                # Only a Retry-After in seconds pauses the limiter; an HTTP date falls back to backoff
+                if retry_after_seconds(response.headers.get('Retry-After')) is None:
+                    time.sleep(self._retry_delay(attempt))
+                attempt += 1
+                metrics.count('retries')
+        metrics.count('uploads')
+        metrics.count('bytes_uploaded', memoryview(data).nbytes)
+        if self.cache is not None and response.status_code == 200 \
+                and 'application/json' in response.headers.get('Content-Type', ''):
+            self.cache.set(key, response.content.decode('utf-8'))
+        return response
+
+    # One request, holding a limiter slot when there is one; urllib3 retries connect errors and 5xx within it
+    def _post_once(self, body, metrics, acquire=True):
+        if self.limiter is not None and acquire:
+            self.limiter.acquire()
+        start = time.perf_counter()
+        try:
+            response = self.session.post(self.url, data=body, headers={'Content-Type': body.content_type},
+                                         timeout=self.timeout)
+        except requests.exceptions.RequestException:
+            if self.limiter is not None:
+                self.limiter.release(status=None)
+            raise
+        retries = getattr(response.raw, 'retries', None)
+        history = retries.history if retries is not None else ()
+        if history:
+            metrics.count('retries', len(history))
+        throttled = sum(attempt.status == 429 for attempt in history) + (response.status_code == 429)
+        if throttled:
+            metrics.count('throttled', throttled)
+        if self.limiter is not None:
+            # A request that needed retries reports its first failure; only clean requests are timed
+            if history:
+                self.limiter.release(status=history[0].status)
+            else:
+                self.limiter.release(time.perf_counter() - start, response.status_code,
+                                     retry_after_seconds(response.headers.get('Retry-After')))
+        return response
+
+    # Delay before the next attempt: Retry-After when the server sends one, exponential backoff otherwise
+    def _retry_delay(self, attempt, retry_after=None):
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return self.backoff_factor * (2 ** attempt)
+
+    # Per-axis factors (x, y) by which a width x height image is downscaled before upload
+    def _upload_scale(self, width, height):
+        scale = 1.0
+        if self.max_side:
+            scale = min(scale, self.max_side / max(width, height))
+        if self.max_pixels:
+            scale = min(scale, (self.max_pixels / (width * height)) ** 0.5)
+        if scale >= 1.0:
+            return 1.0, 1.0
+        new_width, new_height = max(1, round(width * scale)), max(1, round(height * scale))
+        return new_width / width, new_height / height
+
+    # Downscale and encode a BGR frame for upload; returns the encoded array and the scale applied
+    def _encode_frame(self, frame):
+        height, width = frame.shape[:2]
+        scale = self._upload_scale(width, height)
+        if scale != (1.0, 1.0):
+            size = (round(width * scale[0]), round(height * scale[1]))
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        extension, quality_flag = UPLOAD_FORMATS[self.image_format]
+        _, encoded_image = cv2.imencode(extension, frame, [quality_flag, self.quality])
+        return encoded_image, scale
+
+    # Image files are uploaded as-is unless they need downscaling; pass the decoded frame to avoid decoding twice
+    def _prepare_image(self, data, filename, frame=None):
+        if frame is not None:
+            height, width = frame.shape[:2]
+        else:
+            with Image.open(io.BytesIO(data)) as img:
+                width, height = img.size
+        if self._upload_scale(width, height) == (1.0, 1.0):
+            return data, filename, (1.0, 1.0)
+        if frame is None:
+            frame = self._decode_image(data, filename)
+        encoded_image, scale = self._encode_frame(frame)
+        filename = os.path.splitext(filename)[0] + UPLOAD_FORMATS[self.image_format][0]
+        return encoded_image, filename, scale
+
+    # Decode an image buffer to a BGR frame, falling back to Pillow for formats this OpenCV build cannot read
+    def _decode_image(self, data, file_path='image'):
+        frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            try:
+                with Image.open(io.BytesIO(data)) as img:
+                    frame = cv2.cvtColor(np.asarray(img.convert('RGB')), cv2.COLOR_RGB2BGR)
+            except (OSError, ValueError):  # UnidentifiedImageError is an OSError
+                raise ValueError(f"The file '{file_path}' could not be decoded.")
+        return frame
+
+    # Read an image file once; the same buffer is sniffed, uploaded and decoded for annotation
+    def _read_image(self, file_path):
+        if not os.path.isfile(file_path):
+            raise FileNotFoundError(f"The file '{file_path}' does not exist.")
+        # Check the magic bytes before reading the whole file, so a large non-image is rejected cheaply
+        if image_format(read_header(file_path)) is None:
+            raise ValueError(f"The file '{file_path}' is not a valid image file.")
+        with open(file_path, 'rb') as f:
+            return f.read()
+
+    # Map boxes predicted on a downscaled upload back to the original resolution
+    def _rescale_results(self, results, scale):
+        if scale == (1.0, 1.0):
+            return results
+        scale_x, scale_y = scale
+        for model_results in results[:2]:
+            for item in model_results['data']:
+                x1, y1, x2, y2 = item['box_xyxy']
+                item['box_xyxy'] = [x1 / scale_x, y1 / scale_y, x2 / scale_x, y2 / scale_y]
+        return results
+
+    # Encode a decoded frame and upload it; returns the response and the upload scale
+    def _send_frame(self, frame, metrics=NO_METRICS, slot_held=False):
+        with metrics.timer('encode'):
+            encoded_image, scale = self._encode_frame(frame)
+        return self._post(encoded_image, metrics=metrics, slot_held=slot_held), scale
+
+    def _new_metrics(self):
+        return Metrics(self.hooks)
+
+    # Constructor arguments for an equivalent client, e.g. in a worker process
+    def _settings(self):
+        return dict(url=self.url, auth_key=self.auth_key, auth_pass=self.auth_pass, font_size=self.font_size,
+                    font_thickness=self.font_thickness, line_space=self.line_space, detect_mode=self.detect_mode,
+                    label_mode=self.label_mode, pool_size=self.pool_size, keep_alive=self.keep_alive,
+                    timeout=self.timeout, retries=self.retries, backoff_factor=self.backoff_factor, cache=self.cache,
+                    max_side=self.max_side, max_pixels=self.max_pixels, image_format=self.image_format,
+                    quality=self.quality, hooks=[], concurrency=self.limiter)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_video_data_sample(self, file_path, save=False, sample=3, output="output/", temp="temp/",
+                              strategy="random", seed=None, interval=None, with_summary=False):
+        # temp is kept for backwards compatibility: sampled frames are annotated in memory
         if not os.path.exists(output):
             os.makedirs(output)  # Create the output directory if it doesn't exist
 
-        result_data = []
-        frame_names = []
         if not os.path.isfile(file_path):
             raise FileNotFoundError(f"The file '{file_path}' does not exist.")
         
         if not self._is_video_file(file_path):
             raise ValueError(f"The file '{file_path}' is not a valid video file.")
 
+        if strategy not in SAMPLE_STRATEGIES:
+            raise ValueError(f"Invalid strategy: '{strategy}' not found. Please choose one of {', '.join(SAMPLE_STRATEGIES)}.")
+        if strategy == 'interval' and not interval:
+            raise ValueError("The 'interval' strategy needs interval set to the number of seconds between samples.")
+
+        metrics = self._new_metrics()
+        cap = cv2.VideoCapture(file_path)
         try:
-            cap = cv2.VideoCapture(file_path)
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            fps = int(cap.get(cv2.CAP_PROP_FPS))
-            output_video_path = f'{output}{os.path.basename(file_path)}'   
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            out = cv2.VideoWriter(output_video_path, fourcc, fps, (frame_width, frame_height))  
-            
-            # Select 3 random frames to process
-            random_frames = random.sample(range(1, total_frames + 1), sample)
+            # Picked outside the wrapper below so an unusable strategy surfaces as a ValueError
+            sample_frames = self._sample_frame_numbers(cap, file_path, sample, strategy, seed, interval)
+            return self._sample_video_data(cap, sample_frames, save, output, metrics, with_summary)
+        finally:
+            cap.release()
 
-            i = 1
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
-                    break  # End of video
+    # Upload the sampled frames read from cap; the caller owns and releases the capture
+    def _sample_video_data(self, cap, sample_frames, save, output, metrics, with_summary):
+        result_data = []
+        try:
+            # Only the selected frames are decoded; everything in between is skipped
+            for done, (i, frame) in enumerate(self._read_frames(cap, sample_frames, metrics=metrics), 1):
+                response, scale = self._send_frame(frame, metrics)
+                metrics.count('frames')
 
-                # Only process if the frame number is in the selected random frames
-                if i in random_frames:
-                    _, encoded_image = cv2.imencode('.jpg', frame)
-                    image_buffer = io.BytesIO(encoded_image.tobytes())
-                    buffered_reader = io.BufferedReader(image_buffer)
-                    files = {'file': buffered_reader}
-                    response = requests.post(self.url, data=self.credential, files=files)
-                    
-                    if response.status_code == 200:
-                        if 'application/json' in response.headers.get('Content-Type', ''):
-                            data = json.loads(response.text)
-                            result_data.append(data['results'])
+                if response.status_code == 200:
+                    if 'application/json' in response.headers.get('Content-Type', ''):
+                        with metrics.timer('parse'):
+                            data = loads(response.content)
+                        results = self._rescale_results(data['results'], scale)
+                        result_data.append(results)
                         if save:
-                            cv2.imwrite(f'{temp}frame{i}.jpg', frame)
-                            frame_names.append(f'{temp}frame{i}.jpg')
-                            print(f'Processed Frame {i}')  # Show frame progress   
-                i += 1
-            if save:
-                for frame, result in zip(frame_names, result_data):
-                    c_frame = self._img_data(result[0], result[1], frame)
-                    c_frame_np = np.array(c_frame)
-                    c_frame_bgr = cv2.cvtColor(c_frame_np, cv2.COLOR_RGB2BGR)
-                    output_image_path = f'{output}frame{random_frames[frame_names.index(frame)]}.jpg'
-                    cv2.imwrite(output_image_path, c_frame_bgr)  # Save in the output folder
-                    print(f'\nSaved: {output_image_path}')
-                    if os.path.exists(frame):
-                        os.remove(frame)
-            cap.release()
-            out.release()
-
-            if self.detect_mode == 'all':
-                return result_data
-            elif self.detect_mode == 'rating':
-                result = []
-                for r in result_data:
-                    result.append(r[1])
-                return result
-            elif self.detect_mode == 'defect':
-                result = []
-                for r in result_data:
-                    result.append(r[0])
-                return result
-            else:
-                print("someting went wrong")
+                            # Annotate the decoded frame in memory and save it directly
+                            with metrics.timer('render'):
+                                c_frame_bgr = self._render_frame(results, frame)
+                            output_image_path = f'{output}frame{i}.jpg'
+                            with metrics.timer('write'):
+                                cv2.imwrite(output_image_path, c_frame_bgr)  # Save in the output folder
+                else:
+                    metrics.count('dropped')
+                metrics.progress(done, len(sample_frames))
+
+            summary = metrics.finish()
+            if with_summary:
+                return self._select_results(result_data), summary
+            return self._select_results(result_data)
         except Exception as e:
             raise Exception(f"An unexpected error occurred: {e}")
         
 
 
-    def get_video_data(self, file_path, save=False, output="output/", temp="temp/"):
-        if not os.path.exists(temp):
-            os.makedirs(temp)  # Create the temp directory if it doesn't exist
-        if not os.path.exists(output):
-            os.makedirs(output)  # Create the temp directory if it doesn't exist
-
-        result_data = []
-        frame_names = []
-        if not os.path.isfile(file_path):
-            raise FileNotFoundError(f"The file '{file_path}' does not exist.")
-        
-        if not self._is_video_file(file_path):
-            raise ValueError(f"The file '{file_path}' is not a valid video file.")
+    # Pick the 1-based frame numbers to sample, sorted in playback order
+    def _sample_frame_numbers(self, cap, file_path, sample, strategy, seed, interval):
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if strategy == 'random':
+            # A seed makes sampled QA runs reproducible
+            frames = random.Random(seed).sample(range(1, total_frames + 1), sample)
+        elif strategy == 'even':
+            frames = np.linspace(1, total_frames, num=min(sample, total_frames)).round().astype(int).tolist()
+        elif strategy == 'interval':
+            # One frame every `interval` seconds; sample is not used
+            if not fps or fps <= 0:
+                raise ValueError(f"The 'interval' strategy needs the frame rate, which '{file_path}' does not report.")
+            step = max(1, int(round(interval * fps)))
+            frames = list(range(1, total_frames + 1, step))
+        else:
+            keyframes = self._keyframe_numbers(file_path)
+            if len(keyframes) > sample:
+                keyframes = [keyframes[int(i)] for i in np.linspace(0, len(keyframes) - 1, num=sample).round()]
+            frames = keyframes
+        return sorted(set(frames))
+
+    # Keyframe numbers from the container packets, found with grab() in raw mode so nothing is decoded.
+    # Packets arrive in decode order, which differs from display order when the stream has B-frames, so
+    # each packet's frame number is its rank by presentation timestamp.
+    def _keyframe_numbers(self, file_path):
+        if not hasattr(cv2, 'CAP_PROP_LRF_HAS_KEY_FRAME'):
+            raise ValueError("The 'keyframe' strategy requires OpenCV 4.6 or newer built with FFmpeg.")
+        cap = cv2.VideoCapture(file_path, cv2.CAP_FFMPEG, [cv2.CAP_PROP_FORMAT, -1])
+        packets = []  # (PTS, is keyframe) in decode order
         try:
-            cap = cv2.VideoCapture(file_path)
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            fps = int(cap.get(cv2.CAP_PROP_FPS))
-            output_video_path = f'{output}{os.path.basename(file_path)}'   
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            out = cv2.VideoWriter(output_video_path, fourcc, fps, (frame_width, frame_height))  
-            i =1
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
-                    break  # End of video
-                _, encoded_image = cv2.imencode('.jpg', frame)
-                image_buffer = io.BytesIO(encoded_image.tobytes())
-                buffered_reader = io.BufferedReader(image_buffer)
-                files = {'file': buffered_reader}
-                response = requests.post(self.url, data=self.credential, files=files)
-                if response.status_code == 200:
-                    if 'application/json' in response.headers.get('Content-Type', ''):
-                        data = json.loads(response.text)
-                        result_data.append(data['results'])
-                    if save:
-                        cv2.imwrite(f'{temp}frame{i}.jpg', frame)
-                        frame_names.append(f'{temp}frame{i}.jpg')
-                        percentage_complete = (i) / total_frames * 100
-                        # Print the percentage of processing complete
-                        print(f'\rProcessing: {percentage_complete:.2f}%', end='')  # Print on the same line
-                        i += 1
-            if save:
-                i = 1
-                for frame, result in zip(frame_names, result_data):
-                    c_frame = self._img_data(result[0],result[1], frame)
-                    c_frame_np = np.array(c_frame)
-                    c_frame_bgr = cv2.cvtColor(c_frame_np, cv2.COLOR_RGB2BGR)
-                    percentage_written = (i) / total_frames * 100
-                    print(f'\r Frame Writing: {percentage_written:.2f}%', end='')  # Print on the same line
-                    out.write(c_frame_bgr)    
-                    i += 1
-                    if os.path.exists(frame):
-                        os.remove(frame)
+            while cap.grab():
+                packets.append((cap.get(cv2.CAP_PROP_PTS), bool(cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME))))
+        finally:
             cap.release()
-            out.release()
-            print()
-            if self.detect_mode == 'all':
-                return result_data
-            elif self.detect_mode == 'rating':
-                result = []
-                for r in result_data:
-                    result.append(r[1])
-                return result
-            elif self.detect_mode == 'defect':
-                result = []
-                for r in result_data:
-                    result.append(r[0])
-                return result
-            else:
-                print("someting went wrong")
+        # A stable sort keeps decode order for packets without a usable PTS
+        display_order = sorted(range(len(packets)), key=lambda i: packets[i][0])
+        return sorted(number for number, i in enumerate(display_order, 1) if packets[i][1])
+
+    # Decode only the requested (sorted, 1-based) frames: grab() across short gaps, seek across long ones
+    def _read_frames(self, cap, frame_numbers, seek_gap=SEEK_GAP, metrics=NO_METRICS):
+        position = 0  # Frames consumed so far
+        for number in frame_numbers:
+            with metrics.timer('decode'):
+                gap = number - 1 - position
+                if gap > seek_gap:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, number - 1)
+                else:
+                    for _ in range(gap):
+                        if not cap.grab():
+                            return  # End of video
+                ret, frame = cap.read()
+            if not ret:
+                return  # End of video
+            position = number
+            yield number, frame
+
+    def get_video_data(self, file_path, save=False, output="output/", temp="temp/", max_in_flight=1, skip_similar=None,
+                       as_arrays=False, with_summary=False, processes=1, resume=False, track=None):
+        # temp is kept for backwards compatibility: annotated frames now stream straight into the output video
+        # as_arrays=True returns a columnar VideoResults instead of a list of nested dicts
+        # with_summary=True returns (results, Summary) with per-stage timings and counters
+        # processes > 1 splits the video into frame ranges processed in parallel by a process pool
+        # resume=True journals every frame's results and skips frames journaled by an interrupted run
+        # track=N (or a BoxTracker) only uploads keyframes and tracks their boxes through the frames in between
+        result_data = VideoResults() if as_arrays else []
+        metrics = self._new_metrics()
+        if processes > 1:
+            frames = self._sharded_video_data(file_path, save, output, max_in_flight, skip_similar, processes, metrics,
+                                              resume, track)
+        else:
+            frames = self.iter_video_data(file_path, save, output, max_in_flight, skip_similar, metrics, resume, track)
+        try:
+            for index, timestamp, results, _ in frames:
+                if as_arrays:
+                    result_data.append(FrameResult.from_results(results, index, timestamp))
+                else:
+                    result_data.append(results)
+            if not as_arrays:
+                result_data = self._select_results(result_data)
+            if with_summary:
+                return result_data, metrics.summary()
+            return result_data
             # return result_data
         except requests.exceptions.RequestException as e:
             raise Exception(f"An error occurred during the request: {e}")
@@ -221,62 +478,511 @@ class Retrofit:
         except Exception as e:
             raise Exception(f"An unexpected error occurred: {e}")
 
-
-
-    def get_image_data(self, file_path, save=False, output="output/"):
+    # Stream (frame_index, timestamp, results, annotated_frame_or_None) as each frame completes, in frame order.
+    # Nothing is accumulated: with save=True every annotated frame is written to the output video right away.
+    # Annotated frames live in reused decode buffers: copy one to keep it after asking for the next frame.
+    # Pass a Metrics to collect per-stage timings and counters of the run.
+    # With resume=True results are journaled next to the output and a rerun after a failure only uploads the
+    # frames missing from the journal; the journal is removed once the video has been fully processed.
+    # With track set only keyframes are uploaded and the results of the frames in between are tracked locally;
+    # each model's results then carry 'source': 'inferred' or 'tracked'.
+    def iter_video_data(self, file_path, save=False, output="output/", max_in_flight=1, skip_similar=None, metrics=None,
+                        resume=False, track=None):
+        self._check_video(file_path, save or resume, output, max_in_flight)
+        detector = self._change_detector(skip_similar)
+        tracker = self._box_tracker(track, skip_similar)
+        if metrics is None:
+            metrics = self._new_metrics()
+        output_path = f'{output}{os.path.basename(file_path)}' if save else None
+        if not resume:
+            # Validation above runs eagerly; the frames themselves are produced lazily
+            return self._stream_video(file_path, output_path, max_in_flight, detector, metrics, tracker=tracker)
+        journal = Journal(self._journal_path(file_path, output), file_path)
+        return self._remove_when_done(self._stream_video(file_path, output_path, max_in_flight, detector, metrics,
+                                                         journal=journal, tracker=tracker), journal)
+
+    def _journal_path(self, file_path, output, start=0, stop=None):
+        name = f'{output}{os.path.basename(file_path)}.journal'
+        if start or stop is not None:
+            name += f'.{start}-{"end" if stop is None else stop}'
+        return name + '.jsonl'
+
+    # The journal outlives failed or abandoned runs and is removed only after the last frame
+    def _remove_when_done(self, frames, journal):
+        yield from frames
+        journal.remove()
+
+    def _check_video(self, file_path, save, output, max_in_flight):
         if not os.path.isfile(file_path):
             raise FileNotFoundError(f"The file '{file_path}' does not exist.")
-        if not self._is_image_file(file_path):
-            raise ValueError(f"The file '{file_path}' is not a valid image file.")
-        if not os.path.exists(output):
-            os.makedirs(output)
+        if not self._is_video_file(file_path):
+            raise ValueError(f"The file '{file_path}' is not a valid video file.")
+        if max_in_flight < 1:
+            raise ValueError(f"Invalid max_in_flight: {max_in_flight}. It must be at least 1.")
+        if save and not os.path.exists(output):
+            os.makedirs(output)  # Create the output directory if it doesn't exist
+
+    # Process contiguous frame ranges in worker processes, each rebuilding its own client from self._settings().
+    # Returns the same (frame_index, timestamp, results, None) records as iter_video_data, in frame order.
+    # With resume=True every shard keeps its own journal, so resuming needs the same number of processes.
+    def _sharded_video_data(self, file_path, save, output, max_in_flight, skip_similar, processes, metrics,
+                            resume=False, track=None):
+        self._check_video(file_path, save or resume, output, max_in_flight)
+        self._box_tracker(track, skip_similar)
+        # Validation above runs eagerly; the shards run once the records are consumed
+        return self._stream_shards(file_path, save, output, max_in_flight, skip_similar, processes, metrics, resume,
+                                   track)
+
+    def _stream_shards(self, file_path, save, output, max_in_flight, skip_similar, processes, metrics, resume, track):
+        cap = cv2.VideoCapture(file_path)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        cap.release()
+        if total_frames < 2:
+            # Unknown length: nothing to split on
+            yield from self.iter_video_data(file_path, save, output, max_in_flight, skip_similar, metrics, resume,
+                                            track)
+            return
+
+        ranges = shard_ranges(total_frames, processes)
+        # The frame count is only an estimate for many containers, so the last shard reads to the end of the file
+        ranges[-1] = (ranges[-1][0], None)
+        # Segments live next to the output so joining them never crosses filesystems
+        with tempfile.TemporaryDirectory(dir=output if save else None) as segments:
+            segment_paths = [os.path.join(segments, f'segment{i:04d}.mp4') if save else None
+                             for i in range(len(ranges))]
+            journal_paths = [self._journal_path(file_path, output, start, stop) if resume else None
+                             for start, stop in ranges]
+            # Workers share the limiter's ceiling and request budget instead of each getting all of it
+            settings = self._settings()
+            if self.limiter is not None:
+                settings['concurrency'] = self.limiter.split(len(ranges))
+            # spawn: OpenCV and connection pool threads do not survive fork reliably
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=len(ranges), mp_context=context) as pool:
+                futures = {pool.submit(process_shard, type(self), settings, self.label_map, file_path,
+                                       start, stop, segment_path, max_in_flight, skip_similar, journal_path,
+                                       track): (stop or total_frames) - start
+                           for (start, stop), segment_path, journal_path in zip(ranges, segment_paths, journal_paths)}
+                done = 0
+                for future in as_completed(futures):
+                    _, stages, counters = future.result()
+                    metrics.merge(stages, counters)
+                    done += futures[future]
+                    metrics.progress(done, total_frames)
+            records = [record for future in futures for record in future.result()[0]]
+            if save:
+                with metrics.timer('write'):
+                    concat_segments(segment_paths, f'{output}{os.path.basename(file_path)}', int(fps), frame_size)
+        # Journals are dropped only once every shard has succeeded
+        for journal_path in journal_paths:
+            if journal_path is not None:
+                os.remove(journal_path)
+        metrics.finish()
+        for index, timestamp, results in records:
+            yield index, timestamp, results, None
+
+    # skip_similar is either a ChangeDetector or a 'diff' threshold for a default one
+    def _change_detector(self, skip_similar):
+        if skip_similar is None or isinstance(skip_similar, ChangeDetector):
+            return skip_similar
+        return ChangeDetector(threshold=skip_similar)
+
+    # track is either a BoxTracker or a keyframe interval for a default one
+    def _box_tracker(self, track, skip_similar=None):
+        if track is None:
+            return None
+        if skip_similar is not None:
+            raise ValueError("skip_similar and track cannot be combined: pass BoxTracker(scene_change=...) instead.")
+        if isinstance(track, BoxTracker):
+            return track
+        return BoxTracker(interval=track)
+
+    # Frames [start, stop) are read; annotated frames are written to output_path unless it is None
+    # Frames found in the journal are served from it instead of being uploaded; new results are appended to it
+    # With a tracker only keyframes are uploaded (and journaled); the frames in between are tracked in order
+    def _stream_video(self, file_path, output_path, max_in_flight, detector=None, metrics=NO_METRICS, start=0,
+                      stop=None, journal=None, tracker=None):
+        cap = cv2.VideoCapture(file_path)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if stop is not None:
+            total_frames = min(total_frames, stop)
+        total_frames -= start
+        if start:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        save = output_path is not None
+        out = None
+        if save:
+            frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+            out = cv2.VideoWriter(output_path, fourcc, int(fps), (frame_width, frame_height))
+        if detector is not None:
+            detector.reset()
+        if tracker is not None:
+            tracker.reset()
+        # Frames are decoded ahead on a producer thread into a ring of reusable buffers; journaled frames
+        # only need their pixels when the output is saved or tracked through
+        skip = None
+        if journal is not None and not save and tracker is None:
+            skip = lambda index: journal.get(index) is not None
+        producer = FrameProducer(cap, max_in_flight + RING_SLACK, start, stop, skip, metrics) if cap.isOpened() else None
+        # Frames waiting for their upload to finish, kept in frame order. Frames skipped as near-duplicates
+        # share the future of the last submitted frame and reuse its results.
+        pending = deque()
+        in_flight = 0
+        last_upload = None
+        self._reserve_connections(max_in_flight)
+        executor = ThreadPoolExecutor(max_workers=max_in_flight)
         try:
-            with open(file_path, 'rb') as f:
-                files = {'file': f}
-                # print(files)
-                response = requests.post(self.url, data=self.credential, files=files)
-            # Verify if the response is valid before attempting to unpickle
-            if response.status_code == 200:
-                if 'application/json' in response.headers.get('Content-Type', ''):
-                    data = json.loads(response.text)
-                    results = data['results']
-                else:
-                    raise ValueError("Unexpected response format.")
+            while True:
+                item = producer.next() if producer is not None else None
+                ret = item is not None
+                if ret:
+                    frame_index, frame = item
+                    keyframe = tracker is None or tracker.is_keyframe(frame)
+                    recorded = journal.get(frame_index) if journal is not None and keyframe else None
+                    if not keyframe:
+                        # Tracked from the previous frame once it has been handed back
+                        pending.append((frame_index, frame, None, False, None))
+                    elif recorded is not None:
+                        metrics.count('resumed')
+                        pending.append((frame_index, frame, None, False, recorded))
+                    else:
+                        # After a stretch of journaled frames there is no upload for skipped frames to share
+                        uploaded = detector is None or detector.should_submit(frame) or last_upload is None
+                        if uploaded:
+                            last_upload = executor.submit(self._send_frame, frame, metrics)
+                            in_flight += 1
+                        else:
+                            metrics.count('skipped')
+                        pending.append((frame_index, frame, last_upload, uploaded, None))
+                # Keep at most max_in_flight uploads outstanding and hand back finished frames as soon as
+                # possible; drain everything at the end of the video, and whenever every ring buffer is held here
+                while pending and (not ret or in_flight >= max_in_flight or len(pending) >= producer.size
+                                   or pending[0][2] is None or pending[0][2].done()):
+                    index, frame, upload, uploaded, results = pending.popleft()
+                    if uploaded:
+                        in_flight -= 1
+                    metrics.count('frames')
+                    metrics.progress(index - start, total_frames)
+                    try:
+                        if upload is None and results is None:
+                            with metrics.timer('track'):
+                                results = tracker.track(frame)
+                            if results is None:
+                                metrics.count('dropped')
+                                continue  # No keyframe results to track yet
+                            metrics.count('tracked')
+                        else:
+                            if results is None:
+                                response, scale = upload.result()
+                                if response.status_code != 200 or 'application/json' not in response.headers.get('Content-Type', ''):
+                                    metrics.count('dropped')
+                                    continue  # Frame dropped
+                                with metrics.timer('parse'):
+                                    results = self._rescale_results(loads(response.content)['results'], scale)
+                                if journal is not None:
+                                    journal.record(index, results)
+                            if tracker is not None:
+                                results = tracker.observe(frame, results)
+                        annotated_frame = None
+                        if save:
+                            with metrics.timer('render'):
+                                annotated_frame = self._render_frame(results, frame)
+                            with metrics.timer('write'):
+                                out.write(annotated_frame)
+                        timestamp = (index - 1) / fps if fps else 0.0
+                        yield index, timestamp, results, annotated_frame
+                    finally:
+                        producer.release(frame)  # The buffer is decoded into again; copy yielded frames to keep them
+                if not ret:
+                    break  # End of video
+            metrics.finish()
+        finally:
+            # Stop decoding and queued uploads when the consumer stops early
+            if producer is not None:
+                producer.close()
+            for _, _, upload, _, _ in pending:
+                if upload is not None:
+                    upload.cancel()
+            executor.shutdown()
+            if journal is not None:
+                journal.close()
+            cap.release()
+            if out is not None:
+                out.release()
+
+    # Watch a live source and call callback(frame_index, timestamp, results, annotated_frame, latency) for every
+    # analyzed frame until the source ends or the callback returns False; returns the run's Summary.
+    def watch_stream(self, source, callback, save=False, output="output/", max_in_flight=2, realtime=False,
+                     segment_seconds=60, keep_segments=None):
+        metrics = self._new_metrics()
+        frames = self.iter_stream_data(source, save, output, max_in_flight, realtime, segment_seconds, keep_segments,
+                                       metrics)
+        try:
+            for record in frames:
+                if callback(*record) is False:
+                    break
+        finally:
+            frames.close()
+        return metrics.summary()
+
+    # Stream (frame_index, timestamp, results, annotated_frame_or_None, latency) from a live source: a camera
+    # index, an RTSP/HTTP URL or GStreamer pipeline, a file, or an opened cv2.VideoCapture (left open).
+    # Whenever fewer than max_in_flight uploads are outstanding the newest frame is sent; frames captured in the
+    # meantime are dropped, so latency stays bounded. timestamp is seconds since the stream was opened and latency
+    # the seconds from capture to results. realtime=True replays files at their frame rate. With save=True
+    # annotated frames are recorded into segment_seconds long segments in output, keeping the newest
+    # keep_segments of them.
+    def iter_stream_data(self, source, save=False, output="output/", max_in_flight=2, realtime=False,
+                         segment_seconds=60, keep_segments=None, metrics=None):
+        if max_in_flight < 1:
+            raise ValueError(f"Invalid max_in_flight: {max_in_flight}. It must be at least 1.")
+        if save and not os.path.exists(output):
+            os.makedirs(output)  # Create the output directory if it doesn't exist
+        if metrics is None:
+            metrics = self._new_metrics()
+        owned = not isinstance(source, cv2.VideoCapture)
+        cap = cv2.VideoCapture(source) if owned else source
+        if not cap.isOpened():
+            raise ValueError(f"Could not open the video source '{source}'.")
+        # Validation above runs eagerly; frames are captured once the stream is consumed
+        return self._stream_live(cap, owned, save, output, max_in_flight, realtime, segment_seconds, keep_segments,
+                                 metrics)
+
+    def _stream_live(self, cap, owned, save, output, max_in_flight, realtime, segment_seconds, keep_segments,
+                     metrics):
+        reader = LatestFrame(cap, realtime, metrics)
+        recorder = RollingRecorder(output, reader.fps, segment_seconds, keep_segments) if save else None
+        # Frames being uploaded, in capture order: (frame_index, capture time, frame, upload)
+        pending = deque()
+        last = 0
+        slot = False  # A limiter slot claimed for the next frame
+        stopped = False
+        self._reserve_connections(max_in_flight)
+        executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        try:
+            while True:
+                # Finished uploads are handed back before anything else, never held up waiting for a slot
+                if not (pending and pending[0][3].done()) and len(pending) < max_in_flight:
+                    if self.limiter is not None and not slot:
+                        # Claim the slot before picking the frame, so frames never queue inside the limiter
+                        # and the one sent is the newest when the slot frees up
+                        self.limiter.acquire()
+                        slot = True
+                    # Wait for a new frame, or stop waiting as soon as the oldest upload finishes
+                    item = reader.next(last, lambda: bool(pending) and pending[0][3].done())
+                    if item is not None:
+                        index, captured, frame = item
+                        if index - last > 1:
+                            metrics.count('stale', index - last - 1)
+                        last = index
+                        upload = executor.submit(self._send_frame, frame, metrics, slot)
+                        slot = False
+                        upload.add_done_callback(lambda _: reader.notify())
+                        pending.append((index, captured, frame, upload))
+                        continue
+                if not pending:
+                    break  # The source ended and every frame has been handed back
+                if not (pending[0][3].done() or len(pending) >= max_in_flight or reader.ended):
+                    continue
+                index, captured, frame, upload = pending.popleft()
+                metrics.count('frames')
+                try:
+                    response, scale = upload.result()
+                except requests.exceptions.RequestException:
+                    metrics.count('dropped')
+                    continue  # A live stream outlives failed requests
+                if response.status_code != 200 or 'application/json' not in response.headers.get('Content-Type', ''):
+                    metrics.count('dropped')
+                    continue  # Frame dropped
+                with metrics.timer('parse'):
+                    results = self._rescale_results(loads(response.content)['results'], scale)
+                annotated_frame = None
                 if save:
-                    image = self._img_data(results[0], results[1], file_path)
-                    image = np.array(image)
-                    image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-                    # Save the output image
-                    if output:
-                        if not os.path.exists(output):
-                            os.makedirs(output)
-                        cv2.imwrite(f'{output}/{os.path.basename(file_path)}', image)
-                
-                if self.detect_mode == 'all':
-                    return results
-                elif self.detect_mode == 'rating':
-                    return results[1]
-                elif self.detect_mode == 'defect':
-                    return [results[0]]
-                else:
-                    print("someting went wrong")
+                    with metrics.timer('render'):
+                        annotated_frame = self._render_frame(results, frame)
+                    with metrics.timer('write'):
+                        recorder.write(annotated_frame, index)
+                latency = time.perf_counter() - captured
+                metrics.observe('latency', latency)
+                yield index, captured - reader.started, results, annotated_frame, latency
+            stopped = True
+        except GeneratorExit:
+            stopped = True  # The consumer stopped watching, which is how live runs usually end
+            raise
+        finally:
+            reader.close()
+            for _, _, _, upload in pending:
+                # Uploads that never started give back the slot claimed for them
+                if upload.cancel() and self.limiter is not None:
+                    self.limiter.release()
+            if slot:
+                self.limiter.release()
+            executor.shutdown()
+            if recorder is not None:
+                recorder.close()
+            if owned:
+                cap.release()
+            if stopped:
+                metrics.finish()
+
+    # tile (a size in pixels, or a (width, height) pair) splits large images into tiles overlapping by the
+    # fraction overlap that are uploaded concurrently; their boxes are merged back into image coordinates
+    def get_image_data(self, file_path, save=False, output="output/", as_arrays=False, tile=None, overlap=0.2):
+        metrics = self._new_metrics()
+        os.makedirs(output, exist_ok=True)
+        results = self._image_data(file_path, save, output, as_arrays, metrics, tile, overlap)
+        metrics.finish()
+        return results
+
+    def _image_data(self, file_path, save, output, as_arrays, metrics, tile=None, overlap=0.2):
+        with metrics.timer('read'):
+            data = self._read_image(file_path)
+        try:
+            frame = None
+            if save or tile:
+                with metrics.timer('decode'):
+                    frame = self._decode_image(data, file_path)
+            windows = tile_windows(frame.shape[1], frame.shape[0], tile, overlap) if tile else None
+            tiled = windows is not None and len(windows) > 1
+            if tiled:
+                uploads = self._upload_tiles(frame, windows, metrics)
+            else:
+                with metrics.timer('encode'):
+                    payload, filename, scale = self._prepare_image(data, os.path.basename(file_path), frame)
+                uploads = [(self._post(payload, filename, metrics), scale)]
+            metrics.count('frames')
+            results = [self._response_results(response, scale, metrics) for response, scale in uploads]
+            if tiled:
+                with metrics.timer('merge'):
+                    results = merge_tiles(results, windows)
             else:
-                raise Exception(f"Failed to get a valid response. Status code: {response.status_code}, Response: {response.text}")
+                results = results[0]
+            if save:
+                with metrics.timer('render'):
+                    image = self._render_frame(results, frame)
+                # Save the output image
+                if output:
+                    # exist_ok: batch workers may get here concurrently
+                    os.makedirs(output, exist_ok=True)
+                    with metrics.timer('write'):
+                        cv2.imwrite(f'{output}/{os.path.basename(file_path)}', image)
+
+            if as_arrays:
+                return FrameResult.from_results(results)
+            return self._select_image_results(results)
         except requests.exceptions.RequestException as e:
             raise Exception(f"An error occurred during the request: {e}")
         except pickle.UnpicklingError as e:
             raise Exception(f"Failed to unpickle response data: {e}")
         except Exception as e:
             raise Exception(f"An unexpected error occurred: {e}")
-        
+
+    # Verify the response is valid before parsing it; returns results in the coordinates of the uploaded image
+    def _response_results(self, response, scale, metrics=NO_METRICS):
+        if response.status_code != 200:
+            raise Exception(f"Failed to get a valid response. Status code: {response.status_code}, Response: {response.text}")
+        if 'application/json' not in response.headers.get('Content-Type', ''):
+            raise ValueError("Unexpected response format.")
+        with metrics.timer('parse'):
+            data = loads(response.content)
+        return self._rescale_results(data['results'], scale)
+
+    # Encode and upload the tiles of a frame concurrently; returns (response, scale) per window, in order
+    def _upload_tiles(self, frame, windows, metrics):
+        with ThreadPoolExecutor(max_workers=min(len(windows), self.pool_size)) as executor:
+            futures = [executor.submit(self._send_frame, frame[y1:y2, x1:x2], metrics) for x1, y1, x2, y2 in windows]
+            uploads = [future.result() for future in futures]
+        metrics.count('tiles', len(windows))
+        return uploads
+
+    # Analyze a directory or list of images concurrently. Each record is appended to jsonl_path as soon as its
+    # file finishes; a failing file is recorded with its error instead of aborting the batch.
+    def get_images_data(self, paths, save=False, output="output/", workers=8, jsonl_path=None, with_summary=False,
+                        tile=None, overlap=0.2):
+        file_paths = self._list_files(paths)
+        if workers < 1:
+            raise ValueError(f"Invalid workers: {workers}. It must be at least 1.")
+        if save and not os.path.exists(output):
+            os.makedirs(output)  # Created once up front so workers do not race on it
+        self._reserve_connections(workers)
+        records = {}
+        metrics = self._new_metrics()
+        jsonl = open(jsonl_path, 'a') if jsonl_path else None
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(self._image_record, file_path, save, output, metrics, tile, overlap)
+                           for file_path in file_paths]
+                for done, future in enumerate(as_completed(futures), 1):
+                    record = future.result()
+                    records[record['file']] = record
+                    if jsonl is not None:
+                        jsonl.write(json.dumps(record) + '\n')
+                        jsonl.flush()
+                    metrics.progress(done, len(file_paths))
+        finally:
+            if jsonl is not None:
+                jsonl.close()
+        summary = metrics.finish()
+        # Records come back in input order
+        records = [records[file_path] for file_path in file_paths]
+        if with_summary:
+            return records, summary
+        return records
+
+    def _image_record(self, file_path, save, output, metrics, tile=None, overlap=0.2):
+        try:
+            results = self._image_data(file_path, save, output, False, metrics, tile, overlap)
+            return {'file': file_path, 'results': results, 'error': None}
+        except Exception as e:
+            metrics.count('errors')
+            return {'file': file_path, 'results': None, 'error': str(e)}
+
+    # A directory (its files, sorted) or an explicit list of paths
+    def _list_files(self, paths):
+        if isinstance(paths, str):
+            if not os.path.isdir(paths):
+                raise FileNotFoundError(f"The directory '{paths}' does not exist.")
+            return sorted(os.path.join(paths, name) for name in os.listdir(paths)
+                          if os.path.isfile(os.path.join(paths, name)))
+        return list(paths)
+
+    # Shape per-frame video results according to detect_mode
+    def _select_results(self, result_data):
+        if self.detect_mode == 'all':
+            return result_data
+        elif self.detect_mode == 'rating':
+            return [r[1] for r in result_data]
+        elif self.detect_mode == 'defect':
+            return [r[0] for r in result_data]
+        else:
+            print("someting went wrong")
+
+    # Shape single image results according to detect_mode
+    def _select_image_results(self, results):
+        if self.detect_mode == 'all':
+            return results
+        elif self.detect_mode == 'rating':
+            return results[1]
+        elif self.detect_mode == 'defect':
+            return [results[0]]
+        else:
+            print("someting went wrong")
+
+    # Annotate a frame (file path or BGR ndarray) and return it as a BGR ndarray ready for cv2 writers
+    def _render_frame(self, results, file_path):
+        return self._img_data(results[0], results[1], file_path)
 
     def _img_data(self, defect_results, rating_results, file_path):
+        # Frames stay in BGR and are drawn on in place; ndarray input is modified and returned
         if isinstance(file_path, str):
             frame = cv2.imread(file_path)
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         elif isinstance(file_path, np.ndarray):
             frame = file_path
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         else:
             raise ValueError("Invalid input: must be a file path (str) or an image (ndarray)")
 
@@ -284,241 +990,27 @@ class Retrofit:
             print("Error: results are None")
             return
 
-        defect_colors = {
-            0: (255, 0, 0),      # Corrosion: Red
-            1: (0, 255, 0),      # Crack: Green
-            2: (0, 0, 255),      # Abnormal Spacing: Blue
-            3: (255, 165, 0),    # Functional Disorder of Bearing: Orange
-            4: (128, 0, 128),    # Spalling/Exposed Rebar: Purple
-        }
-
-        rating_colors = {
-            0: (95, 15, 64),     # Corrosion_Dt: Dark Magenta (#5F0F40)
-            1: (0, 255, 255),    # Crack_Ct: Cyan (#00FFFF)
-            2: (0, 255, 255),    # Abnormal Spacing_Ct: Cyan (#00FFFF)
-            3: (0, 255, 255),    # Functional Disorder of Bearing_Ct: Cyan (#00FFFF)
-            4: (0, 255, 255),    # Spalling/Exposed Rebar_Ct: Cyan (#00FFFF)
-            5: (0, 255, 255),    # Corrosion_Ct: Cyan (#00FFFF)
-            6: (95, 15, 64),     # Crack_Dt: Dark Magenta (#5F0F40)
-            7: (255, 255, 255),  # Abnormal Spacing_Bt: White (#FFFFFF)
-            8: (255, 255, 255),  # Functional Disorder of Bearing_Bt: White (#FFFFFF)
-            9: (255, 255, 255),  # Spalling/Exposed Rebar_Bt: White (#FFFFFF)
-        }
-
-
-        # Unique color assignment to ensure no duplicates
-        assigned_colors = {}
-
-        # Assign colors to each defect class
-        for item in defect_results['data']:
-            cls = item['box_cls']
-            if cls not in assigned_colors:
-                assigned_colors[cls] = defect_colors.get(cls)  # Use defect colors (0-4)
-
-        # Assign colors to each rating class
-        for item in rating_results['data']:
-            cls = item['box_cls']
-            if cls not in assigned_colors:
-                assigned_colors[cls] = rating_colors.get(cls)  # Use rating colors (0-9)
-
-        # Get the dynamic image dimensions from the current frame
-        height, width, _ = frame.shape
-
-        # Calculate font size relative to the frame dimensions (proportional scaling)
-        font_scale = height / (70 * max(1, int(20 - self.font_size)))
-        font_thickness = self.font_thickness
-        # font_thickness = int(height / (40 * max(1, int(20 - self.font_size))))
-
+        return self._get_renderer().render(frame, defect_results, rating_results)
 
-        if self.detect_mode == "all":
-            # Bounding box drawing for defect and rating
-            for item in defect_results['data']:
-                box_xyxy = item['box_xyxy']
-                cls = item['box_cls']
-                x1, y1, x2, y2 = map(int, box_xyxy)
-
-                box_width = x2 - x1
-                box_height = y2 - y1
-                box_scale = max(2, int(min(box_width, box_height) / 40))
-
-                color = defect_colors.get(cls)  # Use defect colors (0-4)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), color, box_scale)
-
-            for item in rating_results['data']:
-                box_xyxy = item['box_xyxy']
-                cls = item['box_cls']
-                x1, y1, x2, y2 = map(int, box_xyxy)
-
-                box_width = x2 - x1
-                box_height = y2 - y1
-                box_scale = max(2, int(min(box_width, box_height) / 45))
-
-                color = rating_colors.get(cls)  # Use rating colors (0-9)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), color, box_scale)
-        elif self.detect_mode == "defect":
-            for item in defect_results['data']:
-                box_xyxy = item['box_xyxy']
-                cls = item['box_cls']
-                x1, y1, x2, y2 = map(int, box_xyxy)
-
-                box_width = x2 - x1
-                box_height = y2 - y1
-                box_scale = max(2, int(min(box_width, box_height) / 40))
-
-                color = defect_colors.get(cls)  # Use defect colors (0-4)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), color, box_scale)
-        elif self.detect_mode == 'rating':
-            for item in rating_results['data']:
-                box_xyxy = item['box_xyxy']
-                cls = item['box_cls']
-                x1, y1, x2, y2 = map(int, box_xyxy)
-
-                box_width = x2 - x1
-                box_height = y2 - y1
-                box_scale = max(2, int(min(box_width, box_height) / 45))
-
-                color = rating_colors.get(cls)  # Use rating colors (0-9)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), color, box_scale)
-        else:
-            raise ValueError(f"Invalid mode: '{self.detect_mode}' not found. Please choose 'all' or 'defect' or 'rating'.")
-
-        # Label preparation (defects and ratings)
-        reverse_defect_cls = {value: key for key, value in defect_results['cls'].items()}
-        reverse_rating_cls = {value: key for key, value in rating_results['cls'].items()}
-        
-        reverse_label_map = {v: k for k, values in self.label_map.items() for v in values}
-        combine_set = {}
-
-        for defect in defect_results['data']:
-            box_cls = defect['box_cls']
-            defect_cls = defect_results['cls'].get(str(box_cls))
-            if box_cls not in combine_set:
-                combine_set[box_cls] = [{defect_cls : "defect"}]  # Initialize with defect class
-        rating_box_classes = {rating['box_cls'] for rating in rating_results['data']}
-
-        for box in rating_box_classes:
-            get_r_cls = rating_results['cls'].get(str(box))
-            for key, value in combine_set.items():
-                v = list(value[0].keys())[0]
-                if reverse_label_map.get(get_r_cls) in value[0].keys():
-                    combine_set[key].append({get_r_cls:'rating'})
-        
-        # rating_short = {
-        #     'Corrosion_Dt': 'Dt',
-        #     'Crack_Ct': 'Ct',
-        #     'Abnormal Spacing_Ct': 'Ct',
-        #     'Functional Disorder of Bearing_Ct': 'Ct',
-        #     'Spalling/Exposed Rebar_Ct': 'Ct',
-        #     'Corrosion_Ct': 'Ct',
-        #     'Crack_Dt': 'Dt',
-        #     'Abnormal Spacing_Bt': 'Bt',
-        #     'Functional Disorder of Bearing_Bt': 'Bt',
-        #     'Spalling/Exposed Rebar_Bt': 'Bt'
-        # }
-        # for key, value in rating_results['cls'].items():
-        #     print(rating_short.get(value))
-
-        set_dict = defaultdict(set)
-        # Iterate over the dictionary to fill the sets
-        for key, value_list in combine_set.items():
-            for value in value_list:
-                for k, v in value.items():
-                    set_dict[key].add((k, v))
-
-        # Convert back to a regular dictionary
-        set_dict = dict(set_dict)
-        for key, value in set_dict.items():
-            set_dict[key] = sorted(value, key=lambda x: x[1] != 'defect')
-        
-        
-        # filter, only rating
-         
-        # filter, only defect
-        
-
-        if self.label_mode == 'defect':
-            set_dict = {key: {item for item in value if item[1] == 'defect'} for key, value in set_dict.items()}
-        elif self.label_mode == 'rating':
-            set_dict = {key: {item for item in value if item[1] == 'rating'} for key, value in set_dict.items()}
-        elif self.label_mode == 'all':
-            pass
-        else:
-            raise ValueError(f"Invalid mode: '{self.label_mode}' not found. Please choose 'all' or 'defect', 'rating'.")
-
-        # Assume these are already defined earlier in the code with the respective colors:
-        # defect_colors: for defect class colors (5 colors)
-        # rating_colors: for rating class colors (10 colors)
-
-        max_label_width = 0
-        label_strings = []
-
-        # Iterate over the set_dict to process defect and rating labels
-        for color_key, value_set in set_dict.items():
-            # Combine defect and rating labels as a single string for each key
-            combined_label = " ".join([item[0] for item in value_set])  # Extract only the label part from each tuple
-            label_strings.append(combined_label)
-            # Measure the width of the combined label
-            (text_width, _), _ = cv2.getTextSize(combined_label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, font_thickness)
-            max_label_width = max(max_label_width, text_width)
-
-        start_x, start_y = width - max_label_width - 30, 30  # Adjust for right alignment
-
-        # Draw the labels with their corresponding colors
-        for color_key, value_set in set_dict.items():
-            label_x = start_x + 10
-            total_text_height = 0
-            # Iterate through the set of defect and rating tuples
-            for label, class_type in value_set:
-                # Determine if the label is for defect or rating and set the corresponding color
-                if class_type == 'defect':  # For defect class
-                    color = defect_colors.get(int(reverse_defect_cls.get(label)))  # Default to white if no color
-                    # print(color)
-                else:  # For rating class
-                    color = rating_colors.get(int(reverse_rating_cls.get(label)))  # Default to white if no color
-
-                # Get the size of the current text (label)
-                (text_width, text_height), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, font_thickness)
-
-                # Ensure label stays within image bounds
-                if start_y + text_height + 10 > height:
-                    break  # Stop if we're going beyond the image height
-
-                # Draw the label text with the corresponding color
-                cv2.putText(frame, label, (label_x, start_y + text_height), cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, font_thickness)
-
-                # Update the x-coordinate for the next part (spacing between defect and rating labels)
-                label_x += text_width + 10  # Adding 10 for a slight gap between defect and rating labels
-                total_text_height = text_height
-
-            # Move the y-coordinate down for the next label
-            start_y += total_text_height + self.line_space  # Line spacing after each full label
-
-
-
-        # rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        image = Image.fromarray(frame)
-        return image
+    # The renderer is built once and rebuilt only when the annotation settings change
+    def _get_renderer(self):
+        config = (self.detect_mode, self.label_mode, self.font_size, self.font_thickness, self.line_space)
+        if self._renderer is None or self._renderer_config != config:
+            self._renderer = Renderer(*config, label_map=self.label_map)
+            self._renderer_config = config
+        return self._renderer
     
 
-    # Verify if it's an image or not
+    # Verify if it's an image or not, from its magic bytes
     def _is_image_file(self, file_path):
         try:
-            # Try to open the image with Pillow
-            with Image.open(file_path) as img:
-                img.verify()  # Verify that this is indeed an image
-            return True
-        except (IOError, SyntaxError) as e:
+            return image_format(read_header(file_path)) is not None
+        except OSError:
             return False
     
-    # Verify if it's a video file
+    # Verify if it's a video file by probing the container header
     def _is_video_file(self, file_path):
-        # Guess the file type based on its extension
-        file_type, _ = mimetypes.guess_type(file_path)
-        
-        # Supported video formats
-        video_formats = ['video/mp4', 'video/mpeg', 'video/avi', 'video/mov', 'video/mkv']
-        
-        if file_type in video_formats:
-            return True
-        else:
+        try:
+            return video_format(read_header(file_path)) is not None
+        except OSError:
             return False
\ No newline at end of file
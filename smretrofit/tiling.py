@@ -0,0 +1,94 @@
+"""
+Tiled inference for images much larger than what the model sees.
+
+Instead of uploading a huge image (or downscaling it until small defects disappear), the image is
+split into overlapping tiles of a fixed size that are uploaded concurrently, and the tile-local
+boxes are shifted back to image coordinates. Objects in an overlap are found by several tiles and
+objects cut by a tile border come back as partial boxes, so the merged boxes of each model go
+through class-aware non-maximum suppression between tiles. Overlap is measured as intersection over
+the smaller box by default, which also removes a partial box lying inside a complete one from a
+neighbouring tile; boxes found by the same tile never suppress each other, so genuinely nested
+objects of one class survive.
+"""
+
+import numpy as np
+
+from .results import Detections
+
+
+# Boxes of the same class overlapping more than this are duplicates
+MERGE_THRESHOLD = 0.5
+
+MERGE_METRICS = ('ios', 'iou')
+
+
+# (x1, y1, x2, y2) windows of `size` (an int or a (width, height) pair) covering the image, overlapping by a
+# fraction of the tile size; the last row and column are flush with the image edge, so tiles keep their size
+def tile_windows(width, height, size, overlap=0.2):
+    tile_width, tile_height = (size, size) if isinstance(size, int) else size
+    if tile_width < 1 or tile_height < 1:
+        raise ValueError(f"Invalid tile size: {size}. It must be at least 1 pixel.")
+    if not 0 <= overlap < 1:
+        raise ValueError(f"Invalid overlap: {overlap}. It must be at least 0 and less than 1.")
+    return [(x, y, min(x + tile_width, width), min(y + tile_height, height))
+            for y in _starts(height, tile_height, overlap) for x in _starts(width, tile_width, overlap)]
+
+
+def _starts(length, size, overlap):
+    if length <= size:
+        return [0]
+    step = max(1, int(size * (1 - overlap)))
+    return list(range(0, length - size, step)) + [length - size]
+
+
+# Indices of the boxes kept by greedy class-aware NMS, best first. Boxes without a score rank below scored
+# ones and, among equals, larger boxes win, so a complete box is kept over a partial one. With `groups`
+# (e.g. the tile of each box), only boxes of different groups suppress each other.
+def nms(boxes, scores, classes, threshold=MERGE_THRESHOLD, metric='ios', groups=None):
+    if metric not in MERGE_METRICS:
+        raise ValueError(f"Invalid metric: '{metric}' not found. Please choose 'ios' or 'iou'.")
+    if not len(boxes):
+        return np.empty(0, dtype=np.int64)
+    boxes = boxes.astype(np.float64)
+    # Shifting every class into its own region means boxes of different classes never overlap
+    boxes = boxes + classes.astype(np.float64)[:, None] * (boxes.max() - boxes.min() + 1)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    order = np.lexsort((-areas, -np.nan_to_num(scores, nan=-1.0)))
+    keep = []
+    while order.size:
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        width = np.minimum(boxes[best, 2], boxes[rest, 2]) - np.maximum(boxes[best, 0], boxes[rest, 0])
+        height = np.minimum(boxes[best, 3], boxes[rest, 3]) - np.maximum(boxes[best, 1], boxes[rest, 1])
+        intersection = width.clip(0) * height.clip(0)
+        if metric == 'ios':
+            union = np.minimum(areas[best], areas[rest])
+        else:
+            union = areas[best] + areas[rest] - intersection
+        overlap = np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+        suppressed = overlap > threshold
+        if groups is not None:
+            suppressed &= groups[rest] != groups[best]
+        order = rest[~suppressed]
+    return np.array(keep, dtype=np.int64)
+
+
+# Combine the API results of every tile into results for the whole image, in image coordinates
+def merge_tiles(tile_results, windows, threshold=MERGE_THRESHOLD, metric='ios'):
+    merged = []
+    for model in range(2):
+        items, names, scores, classes, tiles = [], {}, [], [], []
+        for tile, (results, (x, y, _, _)) in enumerate(zip(tile_results, windows)):
+            detections = Detections.from_dict(results[model])
+            names.update(detections.names)
+            scores.append(detections.scores)
+            classes.append(detections.classes)
+            tiles.append(np.full(len(detections), tile, dtype=np.int64))
+            # Shift the API's own coordinates, so merged boxes keep their precision
+            items.extend({**item, 'box_xyxy': [v + offset for v, offset in zip(item['box_xyxy'], (x, y, x, y))]}
+                         for item in results[model]['data'])
+        boxes = np.array([item['box_xyxy'] for item in items], dtype=np.float64).reshape(-1, 4)
+        keep = nms(boxes, np.concatenate(scores), np.concatenate(classes), threshold, metric, np.concatenate(tiles))
+        data = [items[i] for i in keep.tolist()]
+        merged.append({'data': data, 'cls': names})
+    return merged + list(tile_results[0][2:])
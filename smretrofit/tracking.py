@@ -0,0 +1,135 @@
+"""
+Keyframe inference with local box tracking between keyframes.
+
+Instead of uploading every frame, BoxTracker picks keyframes (every `interval` frames, and on scene
+changes when a ChangeDetector or threshold is given) and carries the boxes detected on the last
+keyframe over to the frames in between. Boxes are moved with pyramidal Lucas-Kanade optical flow:
+a small grid of points inside each box is tracked from one frame to the next on a downscaled
+grayscale copy, points failing a forward-backward check are discarded, and the box follows the
+median displacement and spread of the points that remain. Boxes whose points are lost stay where
+they were. Results carry a 'source' of 'inferred' (from the API) or 'tracked' (carried over).
+"""
+
+import cv2
+import numpy as np
+
+from .change import ChangeDetector
+
+
+# Minimum surviving points for a box to be moved; below this it keeps its last position
+MIN_POINTS = 3
+
+# Largest change in box size accepted between two consecutive frames
+MAX_SCALE_STEP = 1.25
+
+
+class BoxTracker:
+    def __init__(self, interval=10, scene_change=None, max_side=640, grid=5, max_error=1.0):
+        if interval < 1:
+            raise ValueError(f"Invalid interval: {interval}. It must be at least 1.")
+        if scene_change is not None and not isinstance(scene_change, ChangeDetector):
+            scene_change = ChangeDetector(threshold=scene_change)
+        self.interval = interval
+        self.scene_change = scene_change  # ChangeDetector that also starts a keyframe on a cut
+        self.max_side = max_side          # Flow runs on frames downscaled to at most this side
+        self.grid = grid                  # grid x grid points are tracked in each box
+        self.max_error = max_error        # Forward-backward error, in downscaled pixels, above which a point is lost
+        self.reset()
+
+    def reset(self):
+        self.keyframes = 0
+        self.tracked = 0
+        self._since_keyframe = None
+        self._gray = None
+        self._factor = 1.0
+        self._results = None
+        if self.scene_change is not None:
+            self.scene_change.reset()
+
+    # Called for every frame in playback order: True when the frame should be sent to the API
+    def is_keyframe(self, frame):
+        changed = self.scene_change is not None and self.scene_change.should_submit(frame)
+        if self._since_keyframe is None or self._since_keyframe >= self.interval or changed:
+            self._since_keyframe = 1
+            self.keyframes += 1
+            return True
+        self._since_keyframe += 1
+        self.tracked += 1
+        return False
+
+    # Results detected on a keyframe become the starting point for the frames that follow it
+    def observe(self, frame, results):
+        self._gray, self._factor = self._prepare(frame)
+        self._results = results
+        return self._mark(results, 'inferred')
+
+    # Boxes of the previous frame moved onto this one, or None before the first keyframe has results
+    def track(self, frame):
+        gray, factor = self._prepare(frame)
+        if self._results is None:
+            return None
+        if gray.shape != self._gray.shape:
+            self._gray, self._factor = gray, factor
+            return self._mark(self._results, 'tracked')
+        boxes = [np.array([item['box_xyxy'] for item in model_results['data']], dtype=np.float32).reshape(-1, 4)
+                 for model_results in self._results[:2]]
+        moved = self._move(np.concatenate(boxes) * self._factor, self._gray, gray) / factor
+        height, width = frame.shape[:2]
+        moved[:, 0::2] = moved[:, 0::2].clip(0, width)
+        moved[:, 1::2] = moved[:, 1::2].clip(0, height)
+        results = list(self._results)
+        offset = 0
+        for i, model_results in enumerate(self._results[:2]):
+            data = []
+            for item, box in zip(model_results['data'], moved[offset:offset + len(model_results['data'])].tolist()):
+                data.append({**item, 'box_xyxy': box})
+            offset += len(data)
+            results[i] = {**model_results, 'data': data}
+        self._gray, self._factor = gray, factor
+        self._results = results
+        return self._mark(results, 'tracked')
+
+    def _prepare(self, frame):
+        height, width = frame.shape[:2]
+        factor = min(1.0, self.max_side / max(width, height)) if self.max_side else 1.0
+        if factor < 1.0:
+            frame = cv2.resize(frame, (max(1, round(width * factor)), max(1, round(height * factor))),
+                               interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), factor
+
+    # Move (N, 4) xyxy boxes from prev to gray with the median motion of the points tracked inside each box
+    def _move(self, boxes, prev, gray):
+        if not len(boxes):
+            return boxes
+        steps = np.linspace(0.1, 0.9, self.grid, dtype=np.float32)
+        xs = boxes[:, None, 0:1] + (boxes[:, None, 2:3] - boxes[:, None, 0:1]) * steps[None, :, None]
+        ys = boxes[:, None, 1:2] + (boxes[:, None, 3:4] - boxes[:, None, 1:2]) * steps[None, :, None]
+        points = np.stack(np.broadcast_arrays(xs[:, None, :, 0], ys[:, :, None, 0]), axis=-1).reshape(-1, 1, 2)
+        points = np.ascontiguousarray(points, dtype=np.float32)
+        forward, status, _ = cv2.calcOpticalFlowPyrLK(prev, gray, points, None, winSize=(21, 21), maxLevel=3)
+        backward, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, prev, forward, None, winSize=(21, 21), maxLevel=3)
+        error = np.linalg.norm(backward - points, axis=-1).ravel()
+        valid = ((status.ravel() == 1) & (back_status.ravel() == 1) & (error < self.max_error))
+        count = self.grid * self.grid
+        valid = valid.reshape(-1, count)
+        before = points.reshape(-1, count, 2)
+        after = forward.reshape(-1, count, 2)
+        moved = boxes.copy()
+        ok = valid.sum(axis=1) >= MIN_POINTS
+        if not ok.any():
+            return moved
+        mask = np.where(valid[ok, :, None], 1.0, np.nan)
+        before, after = before[ok] * mask, after[ok] * mask
+        shift = np.nanmedian(after - before, axis=1)
+        # Spread of the points around their median gives the change in box size
+        spread_before = np.nanmedian(np.abs(before - np.nanmedian(before, axis=1, keepdims=True)), axis=1)
+        spread_after = np.nanmedian(np.abs(after - np.nanmedian(after, axis=1, keepdims=True)), axis=1)
+        scale = np.divide(spread_after, spread_before, out=np.ones_like(spread_before), where=spread_before > 0)
+        scale = scale.clip(1 / MAX_SCALE_STEP, MAX_SCALE_STEP)
+        center = (boxes[ok, :2] + boxes[ok, 2:]) / 2 + shift
+        half = (boxes[ok, 2:] - boxes[ok, :2]) / 2 * scale
+        moved[ok] = np.concatenate([center - half, center + half], axis=1)
+        return moved
+
+    def _mark(self, results, source):
+        return [{**model_results, 'source': source} for model_results in results[:2]] + list(results[2:])